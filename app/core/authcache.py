@@ -0,0 +1,89 @@
+"""
+認証済みユーザー（プリンシパル）のキャッシュ
+
+リクエストごとの JWT 検証と users の SELECT を省くため、
+- トークン文字列 → デコード済みペイロード（署名検証結果）
+- user_id → Principal（id/email/level/exp のスナップショット）
+をプロセス内の TTL 付き LRU に保持する。ユーザー行が変わったら events 経由で差し替え/破棄する。
+"""
+import time
+from dataclasses import dataclass, replace
+
+from jose import jwt
+
+from app.core import events
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import ALGORITHM
+from app.core.writebehind import write_behind
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    id: int
+    email: str
+    level: int
+    exp: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, email=user.email, level=user.level, exp=user.exp)
+
+
+token_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL_SEC)
+principal_cache = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_PRINCIPAL_CACHE_TTL_SEC)
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    JWT を検証してペイロードを返す。同じトークンの 2 回目以降は署名検証を省略する。
+    不正なトークンは jose.JWTError を送出する
+    """
+    payload = token_cache.get(token)
+    now = time.time()
+    if payload is not None:
+        if payload.get("exp", now + 1) > now:
+            return payload
+        token_cache.pop(token)
+    payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGORITHM])
+    # トークン自体の有効期限を超えてキャッシュしない
+    token_cache.set(token, payload, ttl=payload.get("exp", now) - now)
+    return payload
+
+
+def get_principal(user_id: int):
+    return principal_cache.get(user_id)
+
+
+def remember_principal(user) -> Principal:
+    principal = Principal.from_user(user)
+    pending = write_behind.pending_exp(principal.id)
+    if pending:
+        # まだ DB に反映していない exp の増減を重ねる
+        principal = replace(principal, exp=principal.exp + pending)
+    principal_cache.set(principal.id, principal)
+    return principal
+
+
+def invalidate_principal(user_id: int) -> None:
+    principal_cache.pop(user_id)
+
+
+@events.subscribe
+def _on_user_changed(event: events.UserChanged) -> None:
+    if event.email is None and event.level is None and event.exp is None:
+        # progress だけの変更はプリンシパルに影響しない
+        return
+    cached = principal_cache.get(event.user_id)
+    if cached is None:
+        return
+    if event.level is None or event.exp is None:
+        # level/exp の片方しか分からない場合は捨てて次回 DB から読み直す
+        invalidate_principal(event.user_id)
+        return
+    principal_cache.replace(event.user_id, replace(
+        cached,
+        email=event.email if event.email is not None else cached.email,
+        level=event.level,
+        exp=event.exp,
+    ))
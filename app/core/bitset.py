@@ -0,0 +1,34 @@
+"""
+進捗フラグのビット表現
+
+User.progress は '0'/'1' の文字列として API に出すが、DB では
+BIGINT のビットマップ（文字列の i 文字目 = 下位から i ビット目）と長さで持つ。
+例: "0110" ⇔ bits=0b0110 の逆順 = 6 (ビット1とビット2), length=4
+"""
+from typing import Iterable
+
+# BIGINT (符号付き 64bit) に収まるビット数
+MAX_BITS = 63
+
+
+def to_bitstring(bits: int, length: int) -> str:
+    return "".join("1" if bits >> i & 1 else "0" for i in range(length))
+
+
+def from_bitstring(value: str) -> int:
+    bits = 0
+    for i, c in enumerate(value):
+        if c == "1":
+            bits |= 1 << i
+    return bits
+
+
+def mask_of(indices: Iterable[int]) -> int:
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return mask
+
+
+def full_mask(length: int = MAX_BITS) -> int:
+    return (1 << length) - 1
@@ -0,0 +1,138 @@
+"""
+カリキュラム（お題・ステップ）のプロセス内カタログ
+
+Topic / Step はシードで投入するほぼ静的なデータなので、起動時にまとめて読み込み、
+ステップの存在確認や xp_reward の参照を DB に問い合わせずに済ませる。
+- CATALOG_TTL_SEC ごとに読み直す（管理画面や seed での追加を取り込むため）
+- 未知の step_id を引かれたときは、前回の読み込みから
+  CATALOG_MISS_RELOAD_SEC 以上経っていれば 1 回だけ読み直す
+- 内容のハッシュを version として持ち、GET /topics の ETag に使う
+"""
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Step, Topic
+
+
+@dataclass(frozen=True, slots=True)
+class StepInfo:
+    id: int
+    topic_id: int
+    order_no: int
+    title: str
+    xp_reward: int
+
+
+@dataclass(frozen=True, slots=True)
+class TopicInfo:
+    id: int
+    title: str
+    description: Optional[str]
+    steps: tuple[StepInfo, ...]
+
+
+class Catalog:
+    def __init__(self, ttl_sec: int, miss_reload_sec: int) -> None:
+        self._ttl_sec = ttl_sec
+        self._miss_reload_sec = miss_reload_sec
+        self._topics: tuple[TopicInfo, ...] = ()
+        self._steps: dict[int, StepInfo] = {}
+        self._tree: list[dict] = []
+        self._tree_json = b"[]"
+        self.version = ""
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def topics(self) -> tuple[TopicInfo, ...]:
+        return self._topics
+
+    @property
+    def tree(self) -> list[dict]:
+        """GET /topics で返す形（お題ごとにステップを order_no 順に並べたもの）"""
+        return self._tree
+
+    @property
+    def tree_json(self) -> bytes:
+        """tree をシリアライズしたもの（読み込みごとに 1 回だけ作る）"""
+        return self._tree_json
+
+    def _age(self) -> float:
+        if self._loaded_at is None:
+            return float("inf")
+        return time.monotonic() - self._loaded_at
+
+    def needs_refresh(self) -> bool:
+        return self._loaded_at is None or (self._ttl_sec > 0 and self._age() >= self._ttl_sec)
+
+    async def load(self, db: AsyncSession) -> None:
+        topic_rows = (await db.execute(
+            select(Topic.id, Topic.title, Topic.description).order_by(Topic.id)
+        )).all()
+        step_rows = (await db.execute(
+            select(Step.id, Step.topic_id, Step.order_no, Step.title, Step.xp_reward)
+              .order_by(Step.topic_id, Step.order_no, Step.id)
+        )).all()
+
+        steps_by_topic: dict[int, list[StepInfo]] = {}
+        for r in step_rows:
+            steps_by_topic.setdefault(r.topic_id, []).append(
+                StepInfo(r.id, r.topic_id, r.order_no, r.title, r.xp_reward)
+            )
+        topics = tuple(
+            TopicInfo(t.id, t.title, t.description, tuple(steps_by_topic.get(t.id, ())))
+            for t in topic_rows
+        )
+        tree = [
+            {
+                "id": t.id,
+                "title": t.title,
+                "description": t.description,
+                "steps": [
+                    {"id": s.id, "order_no": s.order_no, "title": s.title, "xp_reward": s.xp_reward}
+                    for s in t.steps
+                ],
+            }
+            for t in topics
+        ]
+        tree_json = orjson.dumps(tree)
+        version = hashlib.sha1(tree_json).hexdigest()[:16]
+
+        self._topics = topics
+        self._steps = {s.id: s for t in topics for s in t.steps}
+        self._tree = tree
+        self._tree_json = tree_json
+        self.version = version
+        self._loaded_at = time.monotonic()
+
+    async def _reload(self, db: AsyncSession, max_age: float) -> None:
+        async with self._lock:
+            # ロック待ちの間に他のリクエストが読み直していれば何もしない
+            if self._age() >= max_age:
+                await self.load(db)
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        if self.needs_refresh():
+            await self._reload(db, self._ttl_sec if self._loaded_at is not None else 0)
+
+    async def get_step(self, step_id: int, db: AsyncSession) -> Optional[StepInfo]:
+        await self.ensure_fresh(db)
+        step = self._steps.get(step_id)
+        if step is None and self._age() >= self._miss_reload_sec:
+            await self._reload(db, self._miss_reload_sec)
+            step = self._steps.get(step_id)
+        return step
+
+
+catalog = Catalog(
+    ttl_sec=settings.CATALOG_TTL_SEC,
+    miss_reload_sec=settings.CATALOG_MISS_RELOAD_SEC,
+)
@@ -0,0 +1,149 @@
+"""
+レスポンス圧縮（gzip / brotli）
+
+- Accept-Encoding を見て br（brotli パッケージがある場合）→ gzip の順で選ぶ。q=0 のものは使わない
+- 本文が COMPRESSION_MIN_SIZE バイト未満なら圧縮しない（小さい JSON は圧縮のほうが高くつく）
+- 既に Content-Encoding が付いているもの、304 など本文のないもの、画像等の圧縮済み形式はそのまま流す
+- ストリーミング（more_body=True が続く）応答は、最初の塊が閾値を超えていれば逐次圧縮する
+- 圧縮した応答の強い ETag は W/ 付きに変える（バイト列が変わるため。nginx と同じ扱い）
+"""
+import gzip
+import zlib
+from typing import Any, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli  # 任意。無ければ gzip だけ使う
+except ImportError:
+    brotli = None
+
+# 圧縮しても縮まない（既に圧縮されている）形式
+_SKIP_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "application/octet-stream")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding から使う方式を決める（br > gzip、q=0 は除外）"""
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._flush = self._obj.process, self._obj.finish
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._compress, self._flush = self._obj.compress, self._obj.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._flush()
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    """本文全体を一度に圧縮する"""
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[dict] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message) -> None:
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or content_type.startswith(_SKIP_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # 本文の最初の塊を見るまでヘッダーは送らない
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                if len(body) < self.minimum_size and not more_body:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag is not None and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                if more_body:
+                    compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                    del headers["Content-Length"]
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": compressor.compress(body), "more_body": True})
+                else:
+                    data = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                    headers["Content-Length"] = str(len(data))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": data})
+                return
+
+            # ストリーミングの 2 つ目以降の塊
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field
-from typing import Optional
+from pydantic import AliasChoices, Field
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     APP_NAME: str = "GitSimAPI"
@@ -14,21 +14,154 @@ class Settings(BaseSettings):
     DB_HOST: str = "127.0.0.1"
     DB_PORT: int = 3306
     DB_NAME: str
+    # 指定時は DB_* より優先（例: ローカル検証用の sqlite:///./dev.db）
+    DATABASE_URL: Optional[str] = None
+
+    # コネクションプール（MySQL の max_connections >= ワーカー数 * (POOL_SIZE + MAX_OVERFLOW) に収める）
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: Literal["always", "idle", "never"] = "idle"
+    DB_POOL_PING_IDLE_SEC: int = 60
+
+    # 読み取りレプリカ（app/db/replicas.py）。DATABASE_URL と同じ形式の URL を JSON の配列で並べる。
+    # 例: DB_REPLICA_URLS='["mysql+pymysql://app:pw@replica1/app?charset=utf8mb4"]'
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_HEALTH_SEC: float = 5.0  # 生存とレプリケーションの遅れを確認する間隔
+    DB_REPLICA_MAX_LAG_SEC: float = 2.0  # これより遅れているレプリカには振らない
+    DB_REPLICA_STICKY_SEC: float = 5.0  # 書き込んだユーザーの読み取りはこの間 primary から行う
 
     MAIL_SENDER: str
-    MAIL_BACKEND: str = "dummy"  # or "smtp"
-    SMTP_HOST: Optional[str] = None
-    SMTP_PORT: Optional[int] = None
+    # 未指定なら SMTP_HOST があれば smtp、無ければ APP_ENV=dev のときだけ dummy（mail_backend を参照）
+    MAIL_BACKEND: Optional[Literal["dummy", "smtp", "queued"]] = None
+    # 旧来の環境変数名 SMTP_SERVER も受け付ける
+    SMTP_HOST: Optional[str] = Field(None, validation_alias=AliasChoices("SMTP_HOST", "SMTP_SERVER"))
+    SMTP_PORT: int = 587
     SMTP_USER: Optional[str] = None
     SMTP_PASSWORD: Optional[str] = None
+    SMTP_STARTTLS: bool = True
+    SMTP_TIMEOUT_SEC: float = 10.0
+    # MAIL_BACKEND=queued のときの送信キュー
+    MAIL_WORKERS: int = 2          # 同時に張る SMTP 接続数
+    MAIL_QUEUE_SIZE: int = 1000
+    MAIL_BATCH_SIZE: int = 20      # 1 接続でまとめて送る最大件数
+    MAIL_SESSION_IDLE_SEC: int = 30
+
+    # ランキングをDBから全件読み直す間隔（秒）。0 で起動時のみ
+    RANKING_REFRESH_SEC: int = 300
+
+    # お題・ステップのカタログを DB から読み直す間隔（秒）
+    CATALOG_TTL_SEC: int = 300
+    CATALOG_MISS_RELOAD_SEC: int = 5
+
+    # /progress/batch で 1 リクエストに載せられるイベント数
+    PROGRESS_BATCH_MAX: int = 200
+
+    # /progress/summary のユーザー別キャッシュ（進捗が変わると破棄する）
+    SUMMARY_CACHE_SIZE: int = 10_000
+    SUMMARY_CACHE_TTL_SEC: int = 60
+
+    # 認証キャッシュ（トークン検証結果・ユーザー情報をプロセス内に保持）
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_TOKEN_CACHE_TTL_SEC: int = 300
+    AUTH_PRINCIPAL_CACHE_TTL_SEC: int = 30
+
+    # exp / 進捗フラグの書き込みをまとめて反映する（app/core/writebehind.py）
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_FLUSH_SEC: float = 1.0
+    WRITE_BEHIND_MAX_PENDING: int = 1000  # 溜まったユーザー数がこれを超えたら間隔を待たずに反映する
+    WRITE_BEHIND_BATCH: int = 500  # 1 文・1 トランザクションで反映するユーザー数
+
+    # WebSocket のライブ更新（/ws/live, app/core/live.py）
+    LIVE_COALESCE_MS: int = 250  # この間に起きた変化は 1 回にまとめて送る
+    LIVE_SEND_TIMEOUT_SEC: float = 5.0  # 1 回の送信にこれ以上かかる接続は切る
+    LIVE_MAX_BACKLOG: int = 100  # 送信中にこれを超えて変化が溜まる接続は切る
+    LIVE_RANKING_MAX: int = 100  # 購読できる上位件数の上限
+
+    # 期限切れ認証コードの掃除（間隔 0 で無効）
+    VERIFICATION_SWEEP_SEC: int = 60
+    VERIFICATION_SWEEP_BATCH: int = 1000
+
+    # レート制限（"回数/期間"。期間は second/minute/hour/day または "30s"）
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal["memory", "redis"] = "memory"
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # リバースプロキシの背後なら X-Forwarded-For を使う
+    LOGIN_RATE_PER_IP: str = "30/minute"
+    LOGIN_RATE_PER_EMAIL: str = "10/minute"
+    TWOFA_REQUEST_RATE_PER_IP: str = "10/minute"
+    TWOFA_REQUEST_RATE_PER_EMAIL: str = "3/minute"
+
+    # ログ（app/core/logconfig.py）
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: dict[str, str] = {}  # ロガー名ごとのレベル。例: {"app.auth": "DEBUG", "uvicorn.access": "WARNING"}
+    LOG_FORMAT: Literal["text", "json"] = "text"
+    LOG_QUEUE: bool = True  # 書き出しを別スレッドで行う
+
+    # リクエスト計測（/metrics）
+    METRICS_ENABLED: bool = True
+
+    # レスポンス圧縮（app/core/compression.py）。br は brotli パッケージがあるときだけ使う
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # これより小さい本文は圧縮しない（バイト）
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # 開発用 SQL プロファイラ（app/core/profiler.py）。認証なしの /debug/sql-profiles も出るので明示したときだけ有効
+    SQL_PROFILER: bool = False
+    SQL_PROFILER_N1_THRESHOLD: int = 3
+    SQL_PROFILER_KEEP: int = 100
+    PROFILE_SAMPLE_RATE: float = 0.0  # cProfile を取るリクエストの割合
+    PROFILE_DIR: Optional[str] = None  # 指定時は .prof ファイルも保存する
+
+    # 起動時のウォームアップ（app/core/startup.py）
+    STARTUP_WARM_CONNECTIONS: Optional[int] = None  # 先に開いておく DB 接続数。None なら DB_POOL_SIZE（それ以上は開かない）
+    STARTUP_SCHEMA_CHECK: Literal["off", "warn", "strict"] = "warn"  # strict ならテーブル・列・インデックスの不足で起動を止める
+    STARTUP_HASH_WARMUP: bool = True  # ハッシュ用ワーカーを起動して bcrypt を 1 回ずつ実行しておく
+    STARTUP_BUDGET_SEC: float = 10.0  # 起動にこれ以上かかったら警告ログを出す
+
+    # パスワードハッシュ（bcrypt コストと専用ワーカープール）
+    BCRYPT_ROUNDS: int = 12
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_SIZE: int = 32
+    HASH_RETRY_AFTER_SEC: int = 1
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     @property
     def sqlalchemy_url(self) -> str:
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return (
             f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}"
             f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}?charset=utf8mb4"
         )
 
+    @property
+    def mail_backend(self) -> str:
+        """実際に使うメール送信方式。SMTP が設定済みの環境で黙って送信を止めないよう、未指定なら smtp に寄せる"""
+        if self.MAIL_BACKEND is not None:
+            return self.MAIL_BACKEND
+        if self.SMTP_HOST is None and self.APP_ENV == "dev":
+            return "dummy"
+        return "smtp"
+
+    @property
+    def async_sqlalchemy_url(self) -> str:
+        """sqlalchemy_url のドライバを非同期版（aiomysql / aiosqlite）に差し替えたもの"""
+        return to_async_url(self.sqlalchemy_url)
+
+_ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
 settings = Settings()
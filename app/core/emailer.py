@@ -1,33 +1,20 @@
-import sys
+import asyncio
 import logging
 import smtplib
-import os
+import time
 from email.mime.text import MIMEText
 from email.utils import formatdate
+from typing import Optional
 from fastapi import HTTPException
-from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from app.core.config import settings
 
-# 環境変数の読み込み
-load_dotenv()
+# レベルは Settings の LOG_LEVEL / LOG_LEVELS で決める
+logger = logging.getLogger("app.emailer")
 
-# ロガーの設定
-logger = logging.getLogger("uvicorn.emailer")
-logger.setLevel(logging.DEBUG)
-
-# メール設定を環境変数から読み込み
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-
-def send_verification_code(email: str, code: str) -> None:
-    """認証コードをメールで送信する"""
-    try:
-        # 処理開始のログ
-        logger.debug(f"[Emailer] 認証コード送信処理開始: {email}")
-        
-        # メール本文の作成
-        message = f"""
+def build_verification_message(email: str, code: str) -> MIMEText:
+    """認証コードのメールを組み立てる"""
+    message = f"""
 =============================================
 🔐 認証コード情報
 ---------------------------------------------
@@ -40,28 +27,211 @@ def send_verification_code(email: str, code: str) -> None:
 このメールは自動送信されています。
 =============================================
 """
-        
-        # MIMETextオブジェクトの作成
-        msg = MIMEText(message)
-        msg["Subject"] = "認証コードのお知らせ"
-        msg["From"] = SMTP_USER
-        msg["To"] = email
-        msg["Date"] = formatdate()
-        
+    msg = MIMEText(message)
+    msg["Subject"] = "認証コードのお知らせ"
+    msg["From"] = settings.SMTP_USER or settings.MAIL_SENDER
+    msg["To"] = email
+    msg["Date"] = formatdate()
+    return msg
+
+def _open_smtp() -> smtplib.SMTP:
+    # SMTP_* は Settings（.env も含む）から読む
+    smtp = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SEC)
+    if settings.SMTP_STARTTLS:
+        smtp.starttls()  # TLS暗号化を有効化
+    if settings.SMTP_USER:
+        smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return smtp
+
+def send_verification_code(email: str, code: str) -> None:
+    """認証コードをメールで送信する"""
+    try:
+        # 処理開始のログ
+        logger.debug("[Emailer] 認証コード送信処理開始: %s", email)
+
+        # メール本文の作成
+        msg = build_verification_message(email, code)
+
         # SMTPサーバーに接続してメール送信
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-            smtp.starttls()  # TLS暗号化を有効化
-            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        with _open_smtp() as smtp:
             smtp.send_message(msg)
-        
+
         # 成功ログ
-        logger.info(f"[Emailer] ✅ 認証コード送信完了: {email}")
-        
-        # 開発環境用にコンソールにも表示
-        print(f"\n[Emailer Console] 認証コード: {code}", flush=True)
-        
-    except Exception as e:
-        error_msg = f"[Emailer] ❌ 認証コード送信中にエラーが発生: {str(e)}"
-        logger.error(error_msg)
-        print(error_msg, file=sys.stderr, flush=True)
+        logger.info("[Emailer] ✅ 認証コード送信完了: %s", email)
+        logger.debug("[Emailer] 認証コード: %s", code)
+
+    except Exception:
+        logger.exception("[Emailer] ❌ 認証コード送信中にエラーが発生")
         raise HTTPException(status_code=500, detail="認証コードの送信に失敗しました。")
+
+
+class _SmtpSession:
+    """
+    認証済みの SMTP 接続を使い回す。
+    しばらく使っていなかった接続は NOOP で生存確認し、切れていれば張り直す。
+    """
+
+    def __init__(self, idle_check_sec: float) -> None:
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._idle_check_sec = idle_check_sec
+
+    @property
+    def is_open(self) -> bool:
+        return self._smtp is not None
+
+    def _ensure(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > self._idle_check_sec:
+            try:
+                alive = self._smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                alive = False
+            if not alive:
+                self.close()
+        if self._smtp is None:
+            self._smtp = _open_smtp()
+        return self._smtp
+
+    def send_batch(self, messages: list[MIMEText]) -> list[MIMEText]:
+        """まとめて送信し、送れなかったメッセージを返す"""
+        failed = []
+        for msg in messages:
+            try:
+                self._ensure().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # 接続が切れていたら 1 回だけ張り直して再送する
+                self.close()
+                try:
+                    self._ensure().send_message(msg)
+                except (smtplib.SMTPException, OSError) as e:
+                    logger.error("[Emailer] ❌ 再送に失敗: %s: %s", msg["To"], e)
+                    self.close()
+                    failed.append(msg)
+            except smtplib.SMTPException as e:
+                logger.error("[Emailer] ❌ 送信に失敗: %s: %s", msg["To"], e)
+                failed.append(msg)
+            self._last_used = time.monotonic()
+        return failed
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+
+class MailDispatcher:
+    """
+    送信待ちメールをメモリ上のキューに積み、バックグラウンドで送る。
+    ワーカーごとに SMTP 接続を 1 本持ち、溜まっているメールは同じ接続でまとめて送る。
+    プロセスが落ちると未送信分は失われる（認証コードは再リクエストで再発行できる前提）。
+    """
+
+    def __init__(self, workers: int, queue_size: int, batch_size: int, idle_sec: float) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_sec = idle_sec
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._tasks: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"mail-dispatcher-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("[Emailer] 📮 メール送信キューを開始: workers=%d", self.workers)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """キューに残っている分を timeout 秒まで送り切ってから止める"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[Emailer] 未送信のメールを破棄: %d 件", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, msg: MIMEText) -> None:
+        if not self._tasks:
+            raise RuntimeError("MailDispatcher is not started")
+        try:
+            self._queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="メール送信が混み合っています。しばらくしてから再度お試しください。",
+                headers={"Retry-After": "5"},
+            )
+
+    async def _worker(self, worker_id: int) -> None:
+        session = _SmtpSession(idle_check_sec=self.idle_sec)
+        try:
+            while True:
+                try:
+                    msg = await asyncio.wait_for(self._queue.get(), timeout=self.idle_sec)
+                except asyncio.TimeoutError:
+                    # しばらく送るものが無ければ接続を閉じておく
+                    if session.is_open:
+                        await asyncio.to_thread(session.close)
+                    continue
+                batch = [msg]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+                try:
+                    failed = await asyncio.to_thread(session.send_batch, batch)
+                except Exception:
+                    logger.exception("[Emailer] ❌ バッチ送信中にエラーが発生")
+                    await asyncio.to_thread(session.close)
+                    failed = batch
+                self.sent += len(batch) - len(failed)
+                self.failed += len(failed)
+                for _ in batch:
+                    self._queue.task_done()
+        finally:
+            session.close()
+
+
+dispatcher = MailDispatcher(
+    workers=settings.MAIL_WORKERS,
+    queue_size=settings.MAIL_QUEUE_SIZE,
+    batch_size=settings.MAIL_BATCH_SIZE,
+    idle_sec=settings.MAIL_SESSION_IDLE_SEC,
+)
+
+async def deliver_verification_code(email: str, code: str) -> None:
+    """
+    MAIL_BACKEND（未指定なら settings.mail_backend の推定）に応じて認証コードを届ける
+    - dummy:  送信しない（開発用）。コードは APP_ENV=dev のときだけログに出す
+    - smtp:   リクエスト内で SMTP 送信する（スレッドプールで実行）
+    - queued: 送信キューに積んで即座に戻る
+    """
+    backend = settings.mail_backend
+    if backend == "queued":
+        dispatcher.enqueue(build_verification_message(email, code))
+        logger.debug("[Emailer] 📥 認証コードを送信キューに追加: %s", email)
+    elif backend == "smtp":
+        await run_in_threadpool(send_verification_code, email, code)
+    elif settings.APP_ENV == "dev":
+        logger.info("[Emailer] (dummy) 認証コード: %s: %s", email, code)
+    else:
+        # 本番のログに第 2 要素のコードを残さない
+        logger.warning("[Emailer] (dummy) 認証コードを送信していません: %s", email)
@@ -0,0 +1,45 @@
+"""
+ユーザー行の変更通知
+
+exp/level/progress を更新した箇所は commit 後に user_changed() を呼ぶ。
+ランキングや認証キャッシュなど、ユーザーの状態をメモリに持つモジュールは
+subscribe() で購読して自分の状態を更新・破棄する。
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger("app.events")
+
+
+@dataclass(frozen=True, slots=True)
+class UserChanged:
+    user_id: int
+    # None の項目は変わっていない（変更後の値は常に埋めて通知する）
+    email: Optional[str] = None
+    level: Optional[int] = None
+    exp: Optional[int] = None
+    progress: Optional[str] = None
+
+
+_listeners: list[Callable[[UserChanged], None]] = []
+
+
+def subscribe(listener: Callable[[UserChanged], None]) -> Callable[[UserChanged], None]:
+    _listeners.append(listener)
+    return listener
+
+
+def user_changed(user_id: int, **fields) -> None:
+    event = UserChanged(user_id, **fields)
+    for listener in _listeners:
+        try:
+            listener(event)
+        except Exception:
+            # 購読側の失敗で更新リクエスト自体を失敗させない
+            logger.exception("user_changed listener failed: %r", listener)
+
+
+def user_row_changed(user) -> None:
+    """ORM の User から全項目入りの通知を出す"""
+    user_changed(user.id, email=user.email, level=user.level, exp=user.exp, progress=user.progress)
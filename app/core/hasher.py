@@ -0,0 +1,115 @@
+"""
+パスワードハッシュ専用のワーカープール
+
+bcrypt は 1 回で数十〜数百 ms の CPU を使うため、リクエスト処理のスレッドプールや
+GIL と取り合わないよう専用のプロセスプールで実行する。
+実行中 + 待ち行列の件数が HASH_WORKERS + HASH_QUEUE_SIZE を超えたら
+待たせずに 503 (Retry-After 付き) を返して、ログイン集中時もレイテンシを一定に保つ。
+HASH_WORKERS=0 のときはプロセスを作らずスレッドプールで実行する（開発用）。
+ワーカーが落ちて（OOM kill 等）プールが壊れたら作り直して 1 回だけやり直し、それでも駄目なら 503 を返す。
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.core import security
+from app.core.config import settings
+
+logger = logging.getLogger("app.hasher")
+
+
+class HashPool:
+    def __init__(self, workers: int, queue_size: int, retry_after: int) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.queue_size
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # fork だとイベントループやDB接続を子に持ち込むので spawn で起動する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """壊れたプールを捨てる（同時に失敗した他のリクエストが作り直した後なら何もしない）"""
+        if self._executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.restarts += 1
+            logger.warning("hash worker pool is broken, restarting it")
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise self._busy()
+        self._pending += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            for _ in range(2):
+                executor = self._get_executor()
+                try:
+                    return await loop.run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    self._discard(executor)
+            raise self._busy()
+        finally:
+            self._pending -= 1
+
+    async def warm_up(self) -> None:
+        """
+        ワーカーを起動して bcrypt を 1 回ずつ実行しておく（起動時に呼ぶ）。
+        初回のログインがプロセスの起動と app.core.security の import を払わないように
+        """
+        await asyncio.gather(*(
+            self.run(security.hash_password, "warm-up") for _ in range(max(self.workers, 1))
+        ))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hash_pool = HashPool(
+    workers=settings.HASH_WORKERS,
+    queue_size=settings.HASH_QUEUE_SIZE,
+    retry_after=settings.HASH_RETRY_AFTER_SEC,
+)
+
+
+async def hash_password(plain: str) -> str:
+    return await hash_pool.run(security.hash_password, plain)
+
+
+async def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    return await hash_pool.run(security.verify_and_update_password, plain, hashed)
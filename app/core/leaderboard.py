@@ -0,0 +1,352 @@
+"""
+プロセス内ランキング（リーダーボード）
+
+users テーブルを毎回 ORDER BY せずに済むよう、(level DESC, exp DESC, id ASC) の
+順に並んだソート済み構造をメモリ上に保持する。
+- 起動時に users から一括ロードし、以降は exp/level の変更時に差分更新する
+- 複数ワーカー構成では各プロセスが自分の更新しか見えないため、
+  RANKING_REFRESH_SEC ごとに DB から全件を読み直して収束させる
+"""
+import asyncio
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import events
+from app.core.config import settings
+from app.db.models import User
+
+
+@dataclass(slots=True)
+class RankEntry:
+    user_id: int
+    email: str
+    level: int
+    exp: int
+
+    @property
+    def key(self) -> tuple[int, int, int]:
+        return (-self.level, -self.exp, self.user_id)
+
+
+class _RankIndex:
+    """
+    ソート済みキーのバケット分割リスト。
+    バケット長を Fenwick 木で持つので、順位計算・位置指定の取得が O(log n) で済む
+    （挿入・削除のバケット内シフトは最大 2*_LOAD 要素の memmove）。
+    """
+    _LOAD = 512
+
+    def __init__(self) -> None:
+        self._buckets: list[list[tuple]] = []
+        self._maxes: list[tuple] = []
+        self._tree: list[int] = [0]
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def build(self, keys: list[tuple]) -> None:
+        keys.sort()
+        load = self._LOAD
+        self._buckets = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._maxes = [b[-1] for b in self._buckets]
+        self._len = len(keys)
+        self._rebuild_tree()
+
+    def _rebuild_tree(self) -> None:
+        n = len(self._buckets)
+        tree = [0] * (n + 1)
+        for i, b in enumerate(self._buckets, start=1):
+            tree[i] += len(b)
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, i: int, delta: int) -> None:
+        i += 1
+        n = len(self._tree) - 1
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """先頭 i バケットの要素数合計"""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, pos: int) -> tuple[int, int]:
+        """通し位置 pos を (バケット番号, バケット内位置) に変換する"""
+        idx, rem = 0, pos
+        n = len(self._tree) - 1
+        bit = 1 << n.bit_length()
+        while bit:
+            nxt = idx + bit
+            if nxt <= n and self._tree[nxt] <= rem:
+                idx = nxt
+                rem -= self._tree[nxt]
+            bit >>= 1
+        return idx, rem
+
+    def add(self, key: tuple) -> None:
+        if not self._buckets:
+            self._buckets = [[key]]
+            self._maxes = [key]
+            self._len = 1
+            self._rebuild_tree()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            i -= 1
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+        if len(bucket) > 2 * self._LOAD:
+            half = self._LOAD
+            self._buckets[i:i + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[i:i + 1] = [bucket[half - 1], bucket[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, key: tuple) -> None:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            raise KeyError(key)
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            raise KeyError(key)
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def rank(self, key: tuple) -> int:
+        """key より前にある要素数（0 始まりの順位）"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return self._len
+        return self._prefix(i) + bisect_left(self._buckets[i], key)
+
+    def slice(self, start: int, stop: int) -> list[tuple]:
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        out: list[tuple] = []
+        bi, pos = self._locate(start)
+        need = stop - start
+        while need > 0:
+            chunk = self._buckets[bi][pos:pos + need]
+            out.extend(chunk)
+            need -= len(chunk)
+            bi, pos = bi + 1, 0
+        return out
+
+
+class Leaderboard:
+    """ユーザーの (level, exp) を保持し、上位 N 件・順位・周辺順位を返す"""
+
+    def __init__(self, refresh_sec: int) -> None:
+        self._index = _RankIndex()
+        self._entries: dict[int, RankEntry] = {}
+        self._lock = threading.Lock()
+        self._refresh_sec = refresh_sec
+        self._loaded_at: Optional[float] = None
+        # 全件の読み直しは同時に 1 つだけ（期限切れの瞬間に来たリクエストが揃って users を全件読まないように）
+        self._reload_lock = asyncio.Lock()
+        # 読み直し中に届いた update/discard の記録。SELECT 後の変更をスナップショットへ再適用する
+        self._journals: list[list[tuple]] = []
+
+    @property
+    def total(self) -> int:
+        return len(self._index)
+
+    def needs_refresh(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self._refresh_sec > 0 and time.monotonic() - self._loaded_at >= self._refresh_sec
+
+    def load(
+        self,
+        rows: Iterable[tuple[int, str, int, int]],
+        journal: Optional[list[tuple]] = None,
+    ) -> None:
+        """
+        (id, email, level, exp) の行で全件を置き換える。
+        journal（begin_reload の戻り値）を渡すと、行の取得後に届いた変更を再適用してから差し替える
+        """
+        entries = {uid: RankEntry(uid, email, level, exp) for uid, email, level, exp in rows}
+        index = _RankIndex()
+        index.build([e.key for e in entries.values()])
+        with self._lock:
+            if journal is not None:
+                self._end_journal(journal)
+                for op in journal:
+                    if op[0] == "update":
+                        self._apply_update(entries, index, *op[1:])
+                    else:
+                        self._apply_discard(entries, index, op[1])
+            self._entries = entries
+            self._index = index
+            self._loaded_at = time.monotonic()
+
+    def begin_reload(self) -> list[tuple]:
+        """これ以降の update/discard を記録するジャーナルを開く。行を読む前に呼ぶ"""
+        journal: list[tuple] = []
+        with self._lock:
+            self._journals.append(journal)
+        return journal
+
+    def abort_reload(self, journal: list[tuple]) -> None:
+        with self._lock:
+            self._end_journal(journal)
+
+    def _end_journal(self, journal: list[tuple]) -> None:
+        for i, j in enumerate(self._journals):
+            if j is journal:
+                del self._journals[i]
+                return
+
+    async def load_from_db(self, db: AsyncSession) -> None:
+        journal = self.begin_reload()
+        try:
+            result = await db.execute(select(User.id, User.email, User.level, User.exp))
+            rows = [(r.id, r.email, r.level, r.exp) for r in result]
+        except BaseException:
+            self.abort_reload(journal)
+            raise
+        self.load(rows, journal)
+
+    async def ensure_fresh(self, sessions: Callable[[], AsyncSession]) -> None:
+        """
+        期限切れなら sessions() のセッションで読み直す。読み直しは 1 つのリクエストだけが行い、
+        その間の他のリクエストは（一度でも読み込み済みなら）待たずに手元のランキングを使う
+        """
+        if not self.needs_refresh():
+            return
+        if self._reload_lock.locked() and self._loaded_at is not None:
+            return
+        async with self._reload_lock:
+            # ロック待ちの間に他のリクエストが読み直していれば何もしない
+            if self.needs_refresh():
+                async with sessions() as db:
+                    await self.load_from_db(db)
+
+    def update(self, user_id: int, email: Optional[str], level: int, exp: int) -> None:
+        """ユーザーの exp/level 変更（新規登録を含む）を反映する。email=None なら既存の値を使う"""
+        with self._lock:
+            for journal in self._journals:
+                journal.append(("update", user_id, email, level, exp))
+            self._apply_update(self._entries, self._index, user_id, email, level, exp)
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            for journal in self._journals:
+                journal.append(("discard", user_id))
+            self._apply_discard(self._entries, self._index, user_id)
+
+    @staticmethod
+    def _apply_update(
+        entries: dict[int, RankEntry],
+        index: _RankIndex,
+        user_id: int,
+        email: Optional[str],
+        level: int,
+        exp: int,
+    ) -> None:
+        old = entries.get(user_id)
+        if old is not None:
+            if email is None:
+                email = old.email
+            if old.level == level and old.exp == exp:
+                old.email = email
+                return
+            index.remove(old.key)
+        elif email is None:
+            # 未ロードのユーザーは次回の全件ロードで拾う
+            return
+        entry = RankEntry(user_id, email, level, exp)
+        entries[user_id] = entry
+        index.add(entry.key)
+
+    @staticmethod
+    def _apply_discard(entries: dict[int, RankEntry], index: _RankIndex, user_id: int) -> None:
+        old = entries.pop(user_id, None)
+        if old is not None:
+            index.remove(old.key)
+
+    def _rows(self, start: int, keys: list[tuple]) -> list[dict]:
+        rows = []
+        for offset, key in enumerate(keys):
+            e = self._entries[key[2]]
+            rows.append({
+                "rank": start + offset + 1,
+                "user_id": e.user_id,
+                "email": e.email,
+                "level": e.level,
+                "exp": e.exp,
+            })
+        return rows
+
+    def top(self, n: int) -> list[dict]:
+        with self._lock:
+            return self._rows(0, self._index.slice(0, n))
+
+    def after(self, level: int, exp: int, user_id: int, n: int) -> list[dict]:
+        """
+        並び (level DESC, exp DESC, id ASC) で (level, exp, user_id) より後ろの n 件（キーセットの続き）。
+        rank はこちらの並びでの位置から付けるので、上位 N 件（top）と同じ基準になる
+        """
+        key = (-level, -exp, user_id)
+        with self._lock:
+            start = self._index.rank(key)
+            keys = self._index.slice(start, start + n + 1)
+            if keys and keys[0] == key:
+                keys = keys[1:]
+                start += 1
+            return self._rows(start, keys[:n])
+
+    def rank_of(self, user_id: int) -> Optional[int]:
+        """1 始まりの順位。未登録なら None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return self._index.rank(entry.key) + 1
+
+    def around(self, user_id: int, radius: int) -> Optional[tuple[int, list[dict]]]:
+        """(順位, 前後 radius 件を含む行) を返す。未登録なら None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            pos = self._index.rank(entry.key)
+            start = max(pos - radius, 0)
+            keys = self._index.slice(start, pos + radius + 1)
+            return pos + 1, self._rows(start, keys)
+
+
+leaderboard = Leaderboard(refresh_sec=settings.RANKING_REFRESH_SEC)
+
+
+@events.subscribe
+def _on_user_changed(event: events.UserChanged) -> None:
+    if event.level is not None and event.exp is not None:
+        leaderboard.update(event.user_id, event.email, event.level, event.exp)
@@ -0,0 +1,19 @@
+"""
+レベル計算
+
+レベル L から L+1 に上がるには累計 exp が L^2 * 50 以上必要（1→2: 50, 2→3: 200, 3→4: 450 ...）。
+閾値が二次式なので、レベルは整数平方根で O(1) に求まる（1 段ずつループしない）。
+"""
+from math import isqrt
+
+LEVEL_EXP_BASE = 50
+
+
+def exp_for_level(level: int) -> int:
+    """level に到達するのに必要な累計 exp"""
+    return (level - 1) ** 2 * LEVEL_EXP_BASE
+
+
+def level_for_exp(exp: int) -> int:
+    """累計 exp で到達しているレベル（exp_for_level(L) <= exp を満たす最大の L）"""
+    return isqrt(max(exp, 0) // LEVEL_EXP_BASE) + 1
@@ -0,0 +1,188 @@
+"""
+WebSocket でのライブ更新（/ws/live）のためのプロセス内 pub/sub
+
+events.user_changed() を購読し、接続ごとに「送るべきもの」を印として溜めておき、
+送信タスクが LIVE_COALESCE_MS ごとにまとめて送る。
+- me:      自分の level / exp / progress の変化（変わった項目だけ。続けて変われば最後の値にまとめる）
+- rank:    自分の順位（誰かの exp が変わるたびに印を付け、送る時点の順位が前回と違うときだけ送る）
+- ranking: 上位 N 件（N 位以内の誰かが動いたときだけ印を付け、送る時点のランキングが前回と違うときだけ送る）
+送る内容は送る時点の最新の状態から作るので、短時間に何度変わっても 1 回分しか送らない。
+
+送信待ちは接続ごとの印（種類ごとに 1 つ）なので溜まり続けることはないが、
+送信中（相手が受け取らず書き込みが詰まっている間）に LIVE_MAX_BACKLOG 回を超えて印が付いた接続や、
+1 回の送信に LIVE_SEND_TIMEOUT_SEC 以上かかった接続は遅い受信者として切断する（1013）。
+プロセス内のハブなので、複数ワーカーでは自ワーカーで起きた変更だけが届く。
+"""
+import asyncio
+import logging
+from typing import Any
+
+import orjson
+
+from app.core import events
+from app.core.config import settings
+from app.core.leaderboard import leaderboard
+
+logger = logging.getLogger("app.live")
+
+# WebSocket の close code（RFC 6455 / IANA）: 1013 = Try Again Later
+CLOSE_SLOW_CONSUMER = 1013
+
+_UNSENT: Any = object()
+
+
+class Subscriber:
+    """1 接続分の送信待ちと送信済みの状態"""
+
+    def __init__(self, websocket: Any, user_id: int, ranking_limit: int) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        self.ranking_limit = ranking_limit
+        self.me: dict = {}            # まだ送っていない自分の変化（項目ごとに最新値）
+        self.rank_dirty = False
+        self.ranking_dirty = False
+        self.sending = False
+        self.backlog = 0              # 送信中に付いた印の数
+        self.sent_rank: Any = _UNSENT
+        self.sent_ranking: Any = _UNSENT
+        self.wake = asyncio.Event()
+        self.dropped = False
+
+    def mark(self) -> None:
+        if self.sending:
+            self.backlog += 1
+        self.wake.set()
+
+
+class LiveHub:
+    def __init__(self, coalesce_sec: float, send_timeout_sec: float, max_backlog: int) -> None:
+        self.coalesce_sec = coalesce_sec
+        self.send_timeout_sec = send_timeout_sec
+        self.max_backlog = max_backlog
+        self._subscribers: set[Subscriber] = set()
+        self._by_user: dict[int, set[Subscriber]] = {}
+        self.messages_sent = 0
+        self.dropped = 0
+
+    @property
+    def connections(self) -> int:
+        return len(self._subscribers)
+
+    def _add(self, sub: Subscriber) -> None:
+        self._subscribers.add(sub)
+        self._by_user.setdefault(sub.user_id, set()).add(sub)
+
+    def _remove(self, sub: Subscriber) -> None:
+        self._subscribers.discard(sub)
+        subs = self._by_user.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._by_user[sub.user_id]
+
+    # --- 変更の受け取り（events から同期的に呼ばれる） ---
+
+    def publish(self, event: events.UserChanged) -> None:
+        if not self._subscribers:
+            return
+        delta = {
+            k: v for k, v in (("level", event.level), ("exp", event.exp), ("progress", event.progress))
+            if v is not None
+        }
+        for sub in self._by_user.get(event.user_id, ()):
+            sub.me.update(delta)
+            sub.mark()
+        if event.exp is None and event.level is None:
+            return
+
+        # 順位が動いた可能性がある。上位 N 件は、動いたユーザーが N 位以内か前回送った中に居たときだけ
+        rank = leaderboard.rank_of(event.user_id)
+        for sub in self._subscribers:
+            sub.rank_dirty = True
+            if sub.ranking_limit and (
+                (rank is not None and rank <= sub.ranking_limit)
+                or (sub.sent_ranking is not _UNSENT and any(r["user_id"] == event.user_id for r in sub.sent_ranking))
+            ):
+                sub.ranking_dirty = True
+            sub.mark()
+
+    # --- 送信 ---
+
+    def _take(self, sub: Subscriber) -> list[dict]:
+        """溜まっている印から送るメッセージを作る（送る時点の最新の状態で）"""
+        messages = []
+        if sub.me:
+            messages.append({"type": "me", **sub.me})
+            sub.me = {}
+        if sub.rank_dirty:
+            sub.rank_dirty = False
+            rank = leaderboard.rank_of(sub.user_id)
+            if rank != sub.sent_rank:
+                sub.sent_rank = rank
+                messages.append({"type": "rank", "rank": rank})
+        if sub.ranking_dirty:
+            sub.ranking_dirty = False
+            top = leaderboard.top(sub.ranking_limit)
+            if top != sub.sent_ranking:
+                sub.sent_ranking = top
+                messages.append({"type": "ranking", "top": top})
+        return messages
+
+    async def _send_all(self, sub: Subscriber, messages: list[dict]) -> bool:
+        """messages を順に送る。送信中に印が付きすぎたら False（遅い受信者）"""
+        sub.sending = True
+        try:
+            for message in messages:
+                data = orjson.dumps(message).decode()
+                await asyncio.wait_for(sub.websocket.send_text(data), timeout=self.send_timeout_sec)
+                self.messages_sent += 1
+        finally:
+            sub.sending = False
+        backlog, sub.backlog = sub.backlog, 0
+        return backlog <= self.max_backlog
+
+    async def _drop(self, sub: Subscriber, reason: str) -> None:
+        sub.dropped = True
+        self.dropped += 1
+        logger.info("live: dropping slow consumer user_id=%s (%s)", sub.user_id, reason)
+        try:
+            await asyncio.wait_for(sub.websocket.close(code=CLOSE_SLOW_CONSUMER), timeout=1)
+        except Exception:
+            pass
+
+    async def serve(self, sub: Subscriber, state: dict) -> None:
+        """
+        state（接続時点の自分の level / exp / progress）と順位・上位 N 件を送ったあと、
+        接続が切れる（か遅い受信者として切る）まで溜まった変化を送り続ける
+        """
+        sub.me.update(state)
+        sub.rank_dirty = True
+        sub.ranking_dirty = sub.ranking_limit > 0
+        self._add(sub)
+        try:
+            messages = self._take(sub)
+            while True:
+                if not await self._send_all(sub, messages):
+                    await self._drop(sub, "backlog")
+                    return
+                await sub.wake.wait()
+                # 短時間の連続した変更は 1 回にまとめる
+                await asyncio.sleep(self.coalesce_sec)
+                sub.wake.clear()
+                messages = self._take(sub)
+        except asyncio.TimeoutError:
+            await self._drop(sub, "send timeout")
+        finally:
+            self._remove(sub)
+
+
+hub = LiveHub(
+    coalesce_sec=settings.LIVE_COALESCE_MS / 1000,
+    send_timeout_sec=settings.LIVE_SEND_TIMEOUT_SEC,
+    max_backlog=settings.LIVE_MAX_BACKLOG,
+)
+
+
+@events.subscribe
+def _on_user_changed(event: events.UserChanged) -> None:
+    hub.publish(event)
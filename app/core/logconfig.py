@@ -0,0 +1,107 @@
+"""
+ログ設定
+
+- ハンドラはルートロガーに 1 つだけ付ける（uvicorn のロガーも propagate させてまとめる）
+- LOG_QUEUE=True ならリクエスト処理側は QueueHandler でキューに積むだけにし、
+  書き出しは QueueListener のスレッドが行う（stderr への同期 I/O をリクエストから外す）
+- LOG_FORMAT=json なら 1 行 1 JSON で出す
+- レベルは LOG_LEVEL（全体）と LOG_LEVELS（ロガー名ごと、例 {"app.auth": "DEBUG"}）で決める。
+  無効なレベルのログは logger.debug("%s", x) の段階で捨てられ、文字列の組み立ても起きない
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import settings
+
+# LogRecord が元から持っている属性。これ以外は extra= で渡された値として JSON に含める
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# uvicorn が自前のハンドラを付けるロガー。ルートに流して出力を 1 本にする
+_UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    標準の QueueHandler は積む前にメッセージを整形済み文字列へ置き換えるが、
+    JSON で出すために例外のトレースバックは exc_text として別に残す
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def setup_logging() -> None:
+    """ルートロガーを設定し直す。何度呼んでもハンドラは増えない"""
+    global _listener
+    shutdown_logging()
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(_formatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if settings.LOG_QUEUE:
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        root.addHandler(_QueueHandler(q))
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        root.addHandler(stream)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    for name in _UVICORN_LOGGERS:
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.propagate = True
+        logger.setLevel(logging.NOTSET)
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+def shutdown_logging() -> None:
+    """キューに残っているログを書き出してからリスナーを止める（プロセス終了時に呼ばれる）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
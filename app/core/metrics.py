@@ -0,0 +1,227 @@
+"""
+リクエスト計測と /metrics（Prometheus テキスト形式）
+
+- MetricsMiddleware（素の ASGI ミドルウェア）がリクエストごとの処理時間・ステータス・同時実行数を集計する
+  ラベルはルーティング後の scope["route"]（パスのテンプレート）を使うので、
+  /users/1/exp と /users/2/exp は同じ系列になる。マッチしなかったリクエストは "unmatched" にまとめる
+  メソッドも標準のもの以外は "OTHER" にまとめる（任意のメソッド名で系列が増え続けないように）
+- instrument_engine() で SQLAlchemy のイベントを拾い、リクエスト中に発行したクエリ数と DB 時間を加算する
+  （どのリクエストの分かは contextvar で判別する）
+- ヒストグラムのバケットは固定。系列はルートとメソッドごとに初回だけ作り、以降は辞書を引くだけ
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+# pool_status() の項目のうち累計値のもの
+_POOL_COUNTERS = {"connects", "checkouts", "checkins", "invalidations", "pings", "ping_failures", "timeouts"}
+
+# 系列のラベルに使うメソッド。これ以外は "OTHER"
+_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestDBStats:
+    """1 リクエスト中に発行したクエリの件数と合計時間"""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_current_db: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+
+class RouteSeries:
+    __slots__ = ("latency", "queries", "db_seconds", "statuses")
+
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.statuses: dict[int, int] = {}
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        # route のパス -> メソッド -> 系列
+        self._series: dict[str, dict[str, RouteSeries]] = {}
+        self.in_flight = 0
+        self.db_queries_total = 0
+        self.db_seconds_total = 0.0
+
+    def series(self, path: str, method: str) -> RouteSeries:
+        by_method = self._series.get(path)
+        if by_method is None:
+            by_method = self._series[path] = {}
+        series = by_method.get(method)
+        if series is None:
+            series = by_method[method] = RouteSeries()
+        return series
+
+    def observe_query(self, elapsed: float) -> None:
+        self.db_queries_total += 1
+        self.db_seconds_total += elapsed
+        stats = _current_db.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+
+    def render(self, pool: Optional[dict] = None, startup: Optional[dict] = None) -> str:
+        """
+        pool は app.db.pool.pool_status() の結果（数値の項目だけ出す）、
+        startup は app.core.startup.report.snapshot() の結果
+        """
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being processed.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP db_queries_total Statements executed by the API engine.",
+            "# TYPE db_queries_total counter",
+            f"db_queries_total {self.db_queries_total}",
+            "# HELP db_query_seconds_total Time spent executing statements.",
+            "# TYPE db_query_seconds_total counter",
+            f"db_query_seconds_total {self.db_seconds_total:.6f}",
+        ]
+        for key, value in (pool or {}).items():
+            if not isinstance(value, (int, float)):
+                continue
+            if key in _POOL_COUNTERS:
+                lines += [f"# TYPE db_pool_{key}_total counter", f"db_pool_{key}_total {value}"]
+            else:
+                lines += [f"# TYPE db_pool_{key} gauge", f"db_pool_{key} {value}"]
+        if startup and startup.get("total_ms") is not None:
+            lines += [
+                "# HELP app_startup_seconds Time spent in each startup phase (phase=\"total\" for the whole lifespan startup).",
+                "# TYPE app_startup_seconds gauge",
+            ]
+            for phase, ms in {**startup["phases_ms"], "total": startup["total_ms"]}.items():
+                lines.append(f'app_startup_seconds{{phase="{_escape(phase)}"}} {ms / 1000:.6f}')
+
+        items = [
+            (f'method="{method}",route="{_escape(path)}"', series)
+            for path, by_method in sorted(self._series.items())
+            for method, series in sorted(by_method.items())
+        ]
+        lines += [
+            "# HELP http_requests_total Requests by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for labels, series in items:
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+        lines += [
+            "# HELP http_request_duration_seconds Request latency.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for labels, series in items:
+            lines += _histogram_lines("http_request_duration_seconds", labels, series.latency)
+        lines += [
+            "# HELP http_request_db_queries Statements executed per request.",
+            "# TYPE http_request_db_queries histogram",
+        ]
+        for labels, series in items:
+            lines += _histogram_lines("http_request_db_queries", labels, series.queries)
+        lines += [
+            "# HELP http_request_db_seconds_total Time spent in the database by route.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        for labels, series in items:
+            lines.append(f"http_request_db_seconds_total{{{labels}}} {series.db_seconds:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _histogram_lines(name: str, labels: str, hist: Histogram) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """最も外側に置き、ルーティング後の scope["route"] から系列を決める"""
+
+    def __init__(self, app: Any, registry: MetricsRegistry = registry) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        status = 500
+        stats = RequestDBStats()
+        token = _current_db.set(stats)
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.in_flight -= 1
+            _current_db.reset(token)
+            route = scope.get("route")
+            method = scope["method"] if scope["method"] in _METHODS else "OTHER"
+            series = registry.series(route.path if route is not None else "unmatched", method)
+            series.latency.observe(elapsed)
+            series.queries.observe(stats.queries)
+            series.db_seconds += stats.seconds
+            series.statuses[status] = series.statuses.get(status, 0) + 1
+
+
+def instrument_engine(engine: Engine, registry: MetricsRegistry = registry) -> None:
+    """engine で実行された文の件数と時間を registry（と実行中のリクエスト）に加算する"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            registry.observe_query(time.perf_counter() - start)
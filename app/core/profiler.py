@@ -0,0 +1,204 @@
+"""
+開発用の SQL プロファイラ
+
+SQL_PROFILER=true を指定したときだけ、リクエストごとに
+- 実行した文・所要時間・呼び出し元（app/ 内で最初に見つかった行）を記録する
+- 同じ形の文（IN (...) の要素数違いは同一視）が SQL_PROFILER_N1_THRESHOLD 回以上出たら N+1 の候補として挙げる
+- 概要を X-SQL-Profile ヘッダーで返し、詳細は /debug/sql-profiles/{id} で見られるようにする
+- PROFILE_SAMPLE_RATE の割合で cProfile も取り、上位の関数を記録（PROFILE_DIR があれば .prof も保存）する
+  （cProfile はスレッド単位なので、同時に処理中の他のリクエストの分も混ざる。1 度に 1 リクエストだけ取る）
+
+async エンジンのイベントは子 greenlet 内で呼ばれるため、呼び出し元は親 greenlet のフレームから辿る。
+"""
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import re
+import sys
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Optional
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 呼び出し元として扱わないファイル（ミドルウェア）と、より外側があればそちらを優先するもの（DB ヘルパー）
+_IGNORED_FILES = {os.path.abspath(__file__), os.path.join(_APP_DIR, "core", "metrics.py")}
+_HELPER_DIRS = (os.path.join(_APP_DIR, "db"),)
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+
+
+def enabled() -> bool:
+    # /debug/sql-profiles は認証なしで SQL と呼び出し元を見せるので、APP_ENV からは推測しない
+    return settings.SQL_PROFILER
+
+
+def statement_shape(statement: str) -> str:
+    """IN (?, ?, ?) のようなプレースホルダの並びを (?) にまとめ、空白を詰める"""
+    return " ".join(_PLACEHOLDER_LIST.sub("(?)", statement).split())
+
+
+def _call_site() -> str:
+    """app/ 内の呼び出し元（app/db/ のヘルパーより外側を優先）を "path:line func" で返す"""
+    current = greenlet.getcurrent()
+    frame = current.parent.gr_frame if current.parent is not None else sys._getframe(1)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename not in _IGNORED_FILES:
+            site = f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} {frame.f_code.co_name}"
+            if not filename.startswith(_HELPER_DIRS):
+                return site
+            fallback = fallback or site
+        frame = frame.f_back
+    return fallback or "?"
+
+
+class RequestProfile:
+    __slots__ = ("id", "method", "path", "status", "started", "duration_ms", "statements", "profile")
+
+    def __init__(self, profile_id: int, method: str, path: str) -> None:
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.status = 0
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.statements: list[tuple[str, float, str]] = []  # (文, ms, 呼び出し元)
+        self.profile: Optional[str] = None
+
+    @property
+    def db_ms(self) -> float:
+        return sum(ms for _, ms, _ in self.statements)
+
+    def n_plus_one(self) -> list[dict]:
+        counts = Counter(statement_shape(sql) for sql, _, _ in self.statements)
+        suspects = []
+        for shape, count in counts.most_common():
+            if count < settings.SQL_PROFILER_N1_THRESHOLD:
+                break
+            matches = [(ms, site) for sql, ms, site in self.statements if statement_shape(sql) == shape]
+            suspects.append({
+                "sql": shape,
+                "count": count,
+                "total_ms": round(sum(ms for ms, _ in matches), 3),
+                "sites": sorted({site for _, site in matches}),
+            })
+        return suspects
+
+    def header(self) -> str:
+        return (
+            f"id={self.id}; queries={len(self.statements)}; "
+            f"db_ms={self.db_ms:.2f}; n_plus_1={len(self.n_plus_one())}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "queries": len(self.statements),
+            "db_ms": round(self.db_ms, 3),
+            "n_plus_1": self.n_plus_one(),
+            "statements": [
+                {"sql": sql, "ms": round(ms, 3), "site": site} for sql, ms, site in self.statements
+            ],
+            "profile": self.profile,
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+_ids = itertools.count(1)
+recent: "deque[RequestProfile]" = deque(maxlen=settings.SQL_PROFILER_KEEP)
+
+
+def find(profile_id: int) -> Optional[RequestProfile]:
+    # スレッドプールから呼ばれても append と衝突しないようにコピーを走査する
+    for profile in list(recent):
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+class _Sampler:
+    """cProfile は同時に 1 つしか動かせないので、空いているときだけ取る"""
+
+    def __init__(self) -> None:
+        self.busy = False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.busy or settings.PROFILE_SAMPLE_RATE <= 0 or random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return None
+        self.busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler: cProfile.Profile, profile: RequestProfile) -> None:
+        profiler.disable()
+        self.busy = False
+        if settings.PROFILE_DIR:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(settings.PROFILE_DIR, f"request-{profile.id}.prof"))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        profile.profile = out.getvalue()
+
+
+_sampler = _Sampler()
+
+
+class SQLProfilerMiddleware:
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith("/debug/sql-profiles"):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(next(_ids), scope["method"], scope["path"])
+        token = _current.set(profile)
+
+        async def send_with_header(message) -> None:
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-profile", profile.header().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = _sampler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            if profiler is not None:
+                _sampler.finish(profiler, profile)
+            _current.reset(token)
+            profile.duration_ms = (time.perf_counter() - profile.started) * 1000
+            recent.append(profile)
+
+
+def instrument_engine(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current.get() is not None:
+            context._profile_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        start = getattr(context, "_profile_start", None)
+        if profile is None or start is None:
+            return
+        profile.statements.append((statement, (time.perf_counter() - start) * 1000, _call_site()))
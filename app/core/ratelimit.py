@@ -0,0 +1,172 @@
+"""
+レート制限
+
+ログイン（bcrypt 検証）と認証コード送信（DB 書き込み + メール送信）を
+メールアドレス単位・IP 単位で絞る。制限値は Settings に "回数/期間" で書く（例: "5/minute"）。
+
+バックエンド
+- memory: プロセス内のトークンバケット。ワーカーごとに独立して数える
+- redis:  Redis の INCR/EXPIRE によるスライディングウィンドウ（近似）で全ワーカー共通に数える。
+          redis パッケージが必要。INCR/EXPIRE/GET だけを使うので fakeredis 等でも代用できる
+
+ルーターには依存関係として付け、DB セッションやハッシュ計算より先に 429 を返す。
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.ratelimit")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rate":
+        """ "5/minute" や "100/30s" の形式を読む"""
+        count, _, per = spec.partition("/")
+        per = per.strip()
+        if per in _PERIODS:
+            period = _PERIODS[per]
+        elif per.endswith("s") and per[:-1].isdigit():
+            period = int(per[:-1])
+        else:
+            raise ValueError(f"invalid rate: {spec!r}")
+        return cls(limit=int(count), period=float(period))
+
+
+class MemoryBackend:
+    """
+    キーごとのトークンバケット。容量 limit、period 秒で満タンに戻る速度で補充する。
+    キー数は max_keys で抑え、溢れたら最も古く使われたバケットから捨てる。
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, rate: Rate) -> float:
+        """1 回分消費する。許可なら 0、拒否ならあと何秒で 1 回分空くかを返す"""
+        now = time.monotonic()
+        refill = rate.limit / rate.period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(rate.limit), now))
+            tokens = min(float(rate.limit), tokens + (now - updated) * refill)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1.0 - tokens) / refill
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBackend:
+    """
+    スライディングウィンドウ（直前の窓の件数を経過割合で按分して足す近似）。
+    client は redis.asyncio.Redis 互換のオブジェクト（incr/expire/get を持つもの）。
+    """
+
+    def __init__(self, client: Any, prefix: str = "rl:") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    async def hit(self, key: str, rate: Rate) -> float:
+        now = time.time()
+        window = int(now // rate.period)
+        elapsed = now - window * rate.period
+        current_key = f"{self.prefix}{key}:{window}"
+        previous_key = f"{self.prefix}{key}:{window - 1}"
+
+        current = await self.client.incr(current_key)
+        if current == 1:
+            await self.client.expire(current_key, int(rate.period * 2) + 1)
+        previous = int(await self.client.get(previous_key) or 0)
+
+        weight = 1.0 - elapsed / rate.period
+        if previous * weight + current <= rate.limit:
+            return 0.0
+        if current > rate.limit:
+            # 現在の窓だけで超えているので窓が切り替わるまで待つ
+            return rate.period - elapsed
+        # 前の窓の寄与 previous * (1 - t / period) が limit - current 以下になる時刻 t まで待つ
+        t = rate.period * (1.0 - (rate.limit - current) / previous)
+        return max(t - elapsed, 1.0)
+
+
+def _create_backend():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        import redis.asyncio as redis  # 使うときだけ必要
+
+        return RedisBackend(redis.from_url(settings.RATE_LIMIT_REDIS_URL))
+    return MemoryBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+
+
+backend = _create_backend()
+
+
+def client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def _email_of(request: Request) -> Optional[str]:
+    """ボディの email を取り出す（ボディは Request にキャッシュされるのでエンドポイント側で読み直しても問題ない）"""
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    email = body.get("email") if isinstance(body, dict) else None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def rate_limit(scope: str, per_ip: str, per_email: str) -> Callable:
+    """
+    scope ごとに IP 単位・メールアドレス単位の制限をかける依存関係を作る
+
+        @router.post("/login", dependencies=[Depends(rate_limit("login", ...))])
+    """
+    ip_rate = Rate.parse(per_ip)
+    email_rate = Rate.parse(per_email)
+
+    async def dependency(request: Request) -> None:
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        checks = [(f"{scope}:ip:{client_ip(request)}", ip_rate)]
+        email = await _email_of(request)
+        if email:
+            checks.append((f"{scope}:email:{email}", email_rate))
+        for key, rate in checks:
+            retry_after = await backend.hit(key, rate)
+            if retry_after > 0:
+                logger.info("rate limited: %s", key)
+                raise HTTPException(
+                    status_code=429,
+                    detail="リクエストが多すぎます。しばらくしてから再度お試しください。",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    return dependency
@@ -3,8 +3,16 @@ from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# BCRYPT_ROUNDS を変えた場合、既存ハッシュはログイン時に新しいコストで作り直される
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 ALGORITHM = "HS256"
+COOKIE_NAME = "sq_token"
 
 def hash_password(plain: str) -> str:
     return pwd_context.hash(plain)
@@ -12,6 +20,10 @@ def hash_password(plain: str) -> str:
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
+def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """検証結果と、コスト変更などで作り直しが必要な場合の新しいハッシュを返す"""
+    return pwd_context.verify_and_update(plain, hashed)
+
 def create_access_token(sub: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_EXPIRE_MIN)
     payload = {"sub": sub, "exp": expire}
@@ -0,0 +1,156 @@
+"""
+起動時のウォームアップと所要時間の記録
+
+lifespan（app/main.py）から warm_up() を呼び、トラフィックを受ける前に
+デプロイ直後の最初のリクエストが払っていたコストを済ませておく（ローリング再起動でのレイテンシの跳ねを防ぐ）。
+- connections: DB 接続を STARTUP_WARM_CONNECTIONS 本同時に開き、SELECT 1 を流してプールに戻す
+- schema:      テーブル・列・インデックスがモデルどおりか（STARTUP_SCHEMA_CHECK。strict なら起動を止める）
+- replicas:    読み取りレプリカの生存と遅れを確認する（DB_REPLICA_URLS があるときだけ）
+- caches:      ランキング・カリキュラムをメモリへ載せ、JWT の署名・検証を 1 回通しておく
+- hash:        パスワードハッシュのワーカーを起動し bcrypt を 1 回ずつ（CPU は別プロセスなので DB 側と並行）
+フェーズごとの所要時間はログに出し、/health/startup と /metrics（app_startup_seconds）でも返す。
+合計が STARTUP_BUDGET_SEC を超えたら警告する。
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from jose import jwt
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from app.core import security
+from app.core.catalog import catalog
+from app.core.config import settings
+from app.core.hasher import hash_pool
+from app.core.leaderboard import leaderboard
+from app.db.base import AsyncSessionLocal, async_engine
+from app.db.replicas import replica_router
+from app.db.schema import diff_schema
+
+logger = logging.getLogger("app.startup")
+
+
+class StartupReport:
+    """フェーズごとの所要時間"""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.total: Optional[float] = None
+        self._started = 0.0
+
+    def begin(self) -> None:
+        self.phases = {}
+        self.total = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def finish(self, budget_sec: float) -> None:
+        self.total = time.perf_counter() - self._started
+        breakdown = ", ".join(f"{name}={sec * 1000:.0f}ms" for name, sec in self.phases.items())
+        if self.total > budget_sec:
+            logger.warning("startup took %.0fms, over the %.1fs budget (%s)", self.total * 1000, budget_sec, breakdown)
+        else:
+            logger.info("startup finished in %.0fms (%s)", self.total * 1000, breakdown)
+
+    def snapshot(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 3) if self.total is not None else None,
+            "phases_ms": {name: round(sec * 1000, 3) for name, sec in self.phases.items()},
+        }
+
+
+report = StartupReport()
+
+
+async def warm_connections(count: int) -> int:
+    """count 本の接続を同時に開いてからプールに戻す（同時に持たないと同じ 1 本が使い回される）"""
+    if count <= 0:
+        return 0
+
+    async def _open():
+        conn = await async_engine.connect()
+        try:
+            await conn.execute(text("SELECT 1"))
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    results = await asyncio.gather(*(_open() for _ in range(count)), return_exceptions=True)
+    conns = [r for r in results if not isinstance(r, BaseException)]
+    await asyncio.gather(*(conn.close() for conn in conns))
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return len(conns)
+
+
+async def check_schema(mode: str) -> list[str]:
+    if mode == "off":
+        return []
+    async with async_engine.connect() as conn:
+        problems = await conn.run_sync(diff_schema)
+    if problems:
+        message = "schema differs from the models: " + "; ".join(problems)
+        if mode == "strict":
+            raise RuntimeError(message + " (run `python -m app.db.init_db` or add them by hand)")
+        logger.warning(message)
+    return problems
+
+
+async def warm_caches() -> None:
+    # ランキングとカリキュラムを起動時にメモリへ載せておく（初回リクエストで全件ロードしないように）
+    # ランキングは /ranking・/ws/live と同じ single-flight の読み直しを通す
+    await leaderboard.ensure_fresh(AsyncSessionLocal)
+    async with AsyncSessionLocal() as db:
+        await catalog.load(db)
+    logger.info("ランキング %d 件・お題 %d 件をロードしました", leaderboard.total, len(catalog.topics))
+    # 認証: jose の初回の署名・検証（バックエンドの import 等）を済ませておく。
+    # プリンシパルは TTL が短く、誰がアクセスしてくるかも分からないので先読みしない
+    jwt.decode(security.create_access_token("0"), settings.JWT_SECRET, algorithms=[security.ALGORITHM])
+
+
+async def _warm_hash() -> None:
+    start = time.perf_counter()
+    try:
+        await hash_pool.warm_up()
+    except Exception:
+        # 失敗しても初回のログインが遅くなるだけなので起動は続ける
+        logger.warning("hash pool warm-up failed", exc_info=True)
+    finally:
+        report.phases["hash"] = time.perf_counter() - start
+
+
+async def warm_up() -> None:
+    hash_task = asyncio.create_task(_warm_hash()) if settings.STARTUP_HASH_WARMUP else None
+    try:
+        with report.phase("connections"):
+            # プールサイズを超えて開いた分は戻したときに閉じられるだけなので開かない
+            pool = async_engine.sync_engine.pool
+            size = pool.size() if isinstance(pool, QueuePool) else settings.DB_POOL_SIZE
+            warm = settings.STARTUP_WARM_CONNECTIONS
+            await warm_connections(min(size if warm is None else warm, size))
+        with report.phase("schema"):
+            await check_schema(settings.STARTUP_SCHEMA_CHECK)
+        if replica_router.enabled:
+            with report.phase("replicas"):
+                await replica_router.check_all()
+        with report.phase("caches"):
+            await warm_caches()
+        if hash_task is not None:
+            await hash_task
+    except BaseException:
+        if hash_task is not None:
+            hash_task.cancel()
+            await asyncio.gather(hash_task, return_exceptions=True)
+        raise
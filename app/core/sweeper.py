@@ -0,0 +1,89 @@
+"""
+期限切れの認証コードを定期的に削除するバックグラウンドタスク
+
+verification_codes は同じメールアドレスで再発行されたときにしか消えないため、
+放っておくと一度きりのリクエストの分が溜まり続ける。
+lifespan から起動し、expires_at のインデックスを使って古いものから batch_size 件ずつ消す。
+（試行回数を使い切ったコードは verify 時に expires_at を現在時刻にするので同じ条件で消える）
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.db.models import VerificationCode
+
+logger = logging.getLogger("app.sweeper")
+
+
+class ExpirySweeper:
+    def __init__(self, interval_sec: float, batch_size: int) -> None:
+        self.interval_sec = interval_sec
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.deleted = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is not None or self.interval_sec <= 0:
+            return
+        self._task = asyncio.create_task(self._run(), name="verification-code-sweeper")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def sweep_once(self) -> int:
+        """期限切れのコードを全部消し、消した件数を返す（1 バッチ 1 トランザクション）"""
+        total = 0
+        now = datetime.now(timezone.utc)
+        while True:
+            async with AsyncSessionLocal() as db:
+                # MySQL は IN (サブクエリ + LIMIT) を受け付けないので ID を先に取る
+                ids = list(await db.scalars(
+                    select(VerificationCode.id)
+                      .where(VerificationCode.expires_at < now)
+                      .order_by(VerificationCode.expires_at)
+                      .limit(self.batch_size)
+                ))
+                if not ids:
+                    break
+                await db.execute(
+                    delete(VerificationCode)
+                      .where(VerificationCode.id.in_(ids))
+                      .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            total += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            # 大量に溜まっていても他のリクエストを止めないよう、バッチの間で制御を返す
+            await asyncio.sleep(0)
+        self.deleted += total
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                deleted = await self.sweep_once()
+                if deleted:
+                    logger.info("expired verification codes deleted: %d", deleted)
+            except Exception:
+                logger.exception("verification code sweep failed")
+            await asyncio.sleep(self.interval_sec)
+
+
+sweeper = ExpirySweeper(
+    interval_sec=settings.VERIFICATION_SWEEP_SEC,
+    batch_size=settings.VERIFICATION_SWEEP_BATCH,
+)
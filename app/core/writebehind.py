@@ -0,0 +1,212 @@
+"""
+exp / 進捗フラグの書き込みを溜めてまとめて反映するバッファ（WRITE_BEHIND_ENABLED=True のときだけ使う）
+
+チュートリアル中は PUT /users/{id}/exp と PUT /users/{id}/progress/{index} が数秒の間に何度も来る。
+1 回ごとに users の行ロックを取ってコミットする代わりに、ユーザーごとに
+- exp の増減の合計
+- 立てたフラグの OR
+をメモリに溜め、WRITE_BEHIND_FLUSH_SEC ごと（溜まったユーザー数が WRITE_BEHIND_MAX_PENDING を超えたら即時）に
+WRITE_BEHIND_BATCH 人ずつ 1 文の UPDATE（executemany）・1 トランザクションで反映する。
+
+- 読み出し（GET exp / progress、プリンシパル、フラグ別のユーザー一覧）は DB の値に未反映分を重ねて返す
+- 加算と OR だけなので、他の経路の加算（/progress/complete 等）とは順序に関係なく合う。
+  フラグを落とす・上書きする更新の前には flush_user() でそのユーザーの分を先に反映する
+- 反映に失敗した分は次の回に持ち越す。lifespan の終了時に stop() で残りを反映する
+- プロセス内のバッファなので、複数ワーカーではワーカーごとに溜まる（読み出しに重なるのも自ワーカーの分だけ）
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import bindparam, update
+
+from app.core.config import settings
+from app.db import progress_flags
+from app.db.base import async_engine
+from app.db.models import User
+
+logger = logging.getLogger("app.writebehind")
+
+_users = User.__table__
+_FLUSH_STMT = (
+    update(_users)
+    .where(_users.c.id == bindparam("b_id"))
+    .values(
+        exp=_users.c.exp + bindparam("b_exp"),
+        progress_bits=_users.c.progress_bits.op("|")(bindparam("b_bits")),
+    )
+)
+
+
+class _Pending:
+    __slots__ = ("exp", "bits")
+
+    def __init__(self, exp: int = 0, bits: int = 0) -> None:
+        self.exp = exp
+        self.bits = bits
+
+    def merge(self, other: "_Pending") -> None:
+        self.exp += other.exp
+        self.bits |= other.bits
+
+
+class WriteBehindBuffer:
+    def __init__(self, enabled: bool, flush_sec: float, max_pending: int, batch_size: int) -> None:
+        self.enabled = enabled
+        self.flush_sec = flush_sec
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending: dict[int, _Pending] = {}
+        # 反映中（まだコミットしていない）分。読み出しにはこちらも重ねる
+        self._inflight: dict[int, _Pending] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_users = 0
+        self.flushes = 0
+
+    # --- 書き込み ---
+
+    def add_exp(self, user_id: int, amount: int) -> None:
+        self._entry(user_id).exp += amount
+
+    def set_bits(self, user_id: int, mask: int) -> None:
+        self._entry(user_id).bits |= mask
+
+    def _entry(self, user_id: int) -> _Pending:
+        entry = self._pending.get(user_id)
+        if entry is None:
+            entry = self._pending[user_id] = _Pending()
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+        return entry
+
+    # --- 読み出し（未反映分） ---
+
+    def pending_exp(self, user_id: int) -> int:
+        total = 0
+        for source in (self._inflight, self._pending):
+            entry = source.get(user_id)
+            if entry is not None:
+                total += entry.exp
+        return total
+
+    def pending_bits(self, user_id: int) -> int:
+        bits = 0
+        for source in (self._inflight, self._pending):
+            entry = source.get(user_id)
+            if entry is not None:
+                bits |= entry.bits
+        return bits
+
+    def users_with_bit(self, index: int, after_id: int = 0) -> list[int]:
+        """未反映のフラグで index 番目が立っている、after_id より大きいユーザー ID（昇順）"""
+        bit = 1 << index
+        return sorted({
+            user_id
+            for source in (self._inflight, self._pending)
+            for user_id, entry in source.items()
+            if user_id > after_id and entry.bits & bit
+        })
+
+    @property
+    def size(self) -> int:
+        return len(self._pending)
+
+    # --- 反映 ---
+
+    async def flush(self) -> int:
+        """溜まっている分をすべて反映し、反映したユーザー数を返す"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._inflight, self._pending = self._pending, {}
+            try:
+                items = list(self._inflight.items())
+                for i in range(0, len(items), self.batch_size):
+                    await self._write(items[i:i + self.batch_size])
+                    # 反映済みの分は読み出しに重ねない
+                    for user_id, _ in items[i:i + self.batch_size]:
+                        del self._inflight[user_id]
+            except Exception:
+                # 失敗した分は後から溜まった分とまとめて次の回に持ち越す
+                for user_id, entry in self._inflight.items():
+                    later = self._pending.get(user_id)
+                    if later is not None:
+                        entry.merge(later)
+                    self._pending[user_id] = entry
+                raise
+            finally:
+                self._inflight = {}
+            self.flushes += 1
+            self.flushed_users += len(items)
+            return len(items)
+
+    async def flush_user(self, user_id: int) -> None:
+        """1 ユーザー分だけ先に反映する（フラグを落とす・上書きする更新の前に呼ぶ）"""
+        if user_id not in self._pending and user_id not in self._inflight:
+            return
+        async with self._lock:
+            # ロック待ちの間にまとめての反映が終わっていれば何もしない
+            entry = self._pending.pop(user_id, None)
+            if entry is None:
+                return
+            self._inflight[user_id] = entry
+            try:
+                await self._write([(user_id, entry)])
+            except Exception:
+                later = self._pending.get(user_id)
+                if later is not None:
+                    entry.merge(later)
+                self._pending[user_id] = entry
+                raise
+            finally:
+                self._inflight.pop(user_id, None)
+
+    async def _write(self, items: list[tuple[int, _Pending]]) -> None:
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                _FLUSH_STMT,
+                [{"b_id": user_id, "b_exp": entry.exp, "b_bits": entry.bits} for user_id, entry in items],
+            )
+            # 立てたフラグは user_progress_flags にも同じトランザクションで入れる
+            flags = [row for user_id, entry in items for row in progress_flags.flag_rows(user_id, entry.bits)]
+            if flags:
+                await conn.execute(progress_flags.insert_stmt(conn.dialect.name, flags))
+
+    # --- バックグラウンドタスク ---
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="write-behind-flusher")
+
+    async def stop(self) -> None:
+        """タスクを止めて残りを反映する"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending:
+            flushed = await self.flush()
+            logger.info("write-behind: flushed %d users on shutdown", flushed)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("write-behind flush failed (%d users pending)", len(self._pending))
+
+
+write_behind = WriteBehindBuffer(
+    enabled=settings.WRITE_BEHIND_ENABLED,
+    flush_sec=settings.WRITE_BEHIND_FLUSH_SEC,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    batch_size=settings.WRITE_BEHIND_BATCH,
+)
@@ -0,0 +1,101 @@
+"""
+1 文で完結させたい UPDATE / INSERT のためのヘルパー
+"""
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import Row, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.leveling import level_for_exp
+from app.db.models import User
+
+
+async def update_returning(
+    db: AsyncSession,
+    entity: Any,
+    key: Sequence[Any],
+    values: dict,
+    returning: Sequence[Any],
+    when: Sequence[Any] = (),
+) -> Optional[Row]:
+    """
+    key（主キー等）と when の条件に合う行を UPDATE し、更新後の returning 列を返す。
+    対象行が無ければ None。
+    UPDATE ... RETURNING に対応した DB（SQLite / PostgreSQL）では 1 文で済ませ、
+    MySQL / MariaDB（MariaDB の RETURNING は INSERT / DELETE のみ）では同じトランザクション内で UPDATE → SELECT する
+    （UPDATE が取った行ロックはコミットまで保持されるので、他の更新が割り込むことはない）。
+    """
+    stmt = (
+        update(entity)
+        .where(*key, *when)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        result = await db.execute(stmt.returning(*returning))
+        return result.first()
+    result = await db.execute(stmt)
+    if result.rowcount == 0:
+        return None
+    result = await db.execute(select(*returning).where(*key))
+    return result.first()
+
+
+async def increment_exp(
+    db: AsyncSession, user_id: int, amount: int, *, apply_level: bool = True
+) -> Optional[tuple[int, int]]:
+    """
+    exp を SQL 側で加算し (exp, level) を返す。ユーザーが居なければ None。
+    apply_level=True なら加算後の exp に応じてレベルを上げる（下げはしない）。
+    どちらの UPDATE も行ロック下で行うので、同時に加算されても取りこぼしは起きない。
+    """
+    row = await update_returning(
+        db, User,
+        key=[User.id == user_id],
+        values={"exp": User.exp + amount},
+        returning=[User.exp, User.level],
+    )
+    if row is None:
+        return None
+    exp, level = row.exp, row.level
+    if apply_level:
+        new_level = level_for_exp(exp)
+        if new_level > level:
+            await db.execute(
+                update(User)
+                  .where(User.id == user_id, User.level < new_level)
+                  .values(level=new_level)
+                  .execution_options(synchronize_session=False)
+            )
+            level = new_level
+    return exp, level
+
+
+def insert_ignore_stmt(dialect: str, entity: Any, rows: Sequence[dict], conflict: Optional[Sequence[str]] = None):
+    """insert_ignore の文を組み立てる（同期エンジンのスクリプトからも使う）。conflict 省略時はどの一意制約でも無視する"""
+    if dialect == "sqlite":
+        return sqlite.insert(entity).values(list(rows)).on_conflict_do_nothing(index_elements=conflict)
+    if dialect == "postgresql":
+        return postgresql.insert(entity).values(list(rows)).on_conflict_do_nothing(index_elements=conflict)
+    if dialect == "mysql":
+        return mysql.insert(entity).values(list(rows)).prefix_with("IGNORE")
+    raise NotImplementedError(f"insert_ignore is not supported on {dialect}")
+
+
+async def insert_ignore(
+    db: AsyncSession, entity: Any, rows: Sequence[dict], conflict: Sequence[str]
+) -> int:
+    """
+    rows を 1 文で INSERT し、conflict 列の一意制約にぶつかった行は黙って捨てる。
+    実際に挿入された行数を返す（0 なら全部既存だった）。
+    - SQLite / PostgreSQL: INSERT ... ON CONFLICT (conflict) DO NOTHING
+    - MySQL: INSERT IGNORE
+      （ON DUPLICATE KEY UPDATE は CLIENT_FOUND_ROWS 下で「挿入」と「変化なし」の
+      件数が同じ 1 になり区別できないため使わない）
+    """
+    if not rows:
+        return 0
+    stmt = insert_ignore_stmt(db.get_bind().dialect.name, entity, rows, conflict)
+    result = await db.execute(stmt)
+    return result.rowcount
@@ -1,9 +1,25 @@
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.core.config import settings
+from app.db.pool import instrument, pool_options
 
-engine = create_engine(settings.sqlalchemy_url, pool_pre_ping=True, future=True)
+# 同期エンジン: シード投入・テーブル作成などのスクリプト用
+engine = create_engine(
+    settings.sqlalchemy_url, future=True,
+    **pool_options(settings.sqlalchemy_url, is_async=False),
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# 非同期エンジン: API のリクエスト処理用（aiomysql / ローカル検証では aiosqlite）
+async_engine = create_async_engine(
+    settings.async_sqlalchemy_url,
+    **pool_options(settings.async_sqlalchemy_url, is_async=True),
+)
+instrument(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 class Base(DeclarativeBase):
     pass
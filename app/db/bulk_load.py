@@ -0,0 +1,246 @@
+# app/db/bulk_load.py
+"""
+CSV / JSONL からの一括投入（ステージング環境のデータ作成用）
+
+    python -m app.db.bulk_load users users.csv
+    python -m app.db.bulk_load progress progress.jsonl --chunk 5000
+    BCRYPT_ROUNDS=4 python -m app.db.bulk_load users users.jsonl --hash-workers 8
+
+ファイルは 1 行ずつ読み、--chunk 行ごとに 1 文の INSERT ... VALUES (...), (...) と 1 トランザクションで入れる。
+途中で失敗した場合、それまでのチャンクはコミット済みなので --on-conflict ignore で再実行すれば続きから入る。
+
+種類ごとの列（CSV はヘッダー行、JSONL はキー）
+- topics:   title, description
+- steps:    topic_id または topic_title, order_no, title, [xp_reward]（省略時はモデルの既定値）
+- users:    email, password または password_hash, [exp], [level], [progress]（"0110" 形式）
+            level を省略すると exp から計算する
+- progress: user_id または email, step_id, [cleared_at]（ISO 8601）
+
+password は bcrypt でハッシュ化する（--hash-workers でプロセス並列）。
+BCRYPT_ROUNDS を下げて入れておけば、本来のコストへはログイン時に自動で付け替わる。
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+from app.core.bitset import MAX_BITS, from_bitstring
+from app.core.leveling import level_for_exp
+from app.core.security import hash_password
+from app.db import progress_flags
+from app.db.atomic import insert_ignore_stmt
+from app.db.base import engine
+from app.db.models import Step, Topic, User, UserStepProgress
+
+
+# 複数行の INSERT は行ごとに列を省略できないので、xp_reward が空の行にはモデルの既定値を入れる
+_DEFAULT_XP_REWARD = Step.__table__.c.xp_reward.default.arg
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    """CSV / JSONL を 1 行ずつ dict で返す（"-" なら標準入力）"""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _blank(value) -> bool:
+    return value is None or value == ""
+
+
+class _Resolver:
+    """topic_title → topic_id と email → user_id の引き当て（チャンク単位でまとめて引く）"""
+
+    def __init__(self) -> None:
+        self._topics: Optional[dict[str, int]] = None
+
+    def topic_id(self, conn: Connection, title: str) -> int:
+        if self._topics is None:
+            self._topics = dict(conn.execute(select(Topic.title, Topic.id)).all())
+        try:
+            return self._topics[title]
+        except KeyError:
+            raise ValueError(f"unknown topic: {title!r}")
+
+    def user_ids(self, conn: Connection, emails: Iterable[str]) -> dict[str, int]:
+        emails = list(set(emails))
+        if not emails:
+            return {}
+        return dict(conn.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+
+
+class Loader:
+    def __init__(self, chunk_size: int, on_conflict: str, hash_workers: int) -> None:
+        self.chunk_size = chunk_size
+        self.on_conflict = on_conflict
+        self.hash_workers = hash_workers
+        self._resolver = _Resolver()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> "Loader":
+        if self.hash_workers > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.hash_workers)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    # --- 行の変換（ファイルの 1 行 → テーブルの列） ---
+
+    def _topics(self, conn: Connection, rows: list[dict]) -> list[dict]:
+        return [{"title": r["title"], "description": r.get("description") or None} for r in rows]
+
+    def _steps(self, conn: Connection, rows: list[dict]) -> list[dict]:
+        return [
+            {
+                "topic_id": int(r["topic_id"]) if not _blank(r.get("topic_id"))
+                else self._resolver.topic_id(conn, r["topic_title"]),
+                "order_no": int(r["order_no"]),
+                "title": r["title"],
+                "xp_reward": int(r["xp_reward"]) if not _blank(r.get("xp_reward")) else _DEFAULT_XP_REWARD,
+            }
+            for r in rows
+        ]
+
+    def _users(self, conn: Connection, rows: list[dict]) -> list[dict]:
+        if self.on_conflict == "ignore":
+            # 再実行時に入れ済みの行までハッシュ計算しないよう、既存のメールアドレスは先に落とす
+            known = self._resolver.user_ids(conn, (r["email"].strip().lower() for r in rows))
+            rows = [r for r in rows if r["email"].strip().lower() not in known]
+        for r in rows:
+            if _blank(r.get("password_hash")) and _blank(r.get("password")):
+                raise ValueError(f"user {r['email']!r} has neither password nor password_hash")
+        plain = [(i, r["password"]) for i, r in enumerate(rows) if _blank(r.get("password_hash"))]
+        passwords = [p for _, p in plain]
+        if self._pool is not None:
+            chunksize = max(len(passwords) // (self.hash_workers * 4), 1)
+            hashes = list(self._pool.map(hash_password, passwords, chunksize=chunksize))
+        else:
+            hashes = [hash_password(p) for p in passwords]
+        hashed = {i: h for (i, _), h in zip(plain, hashes)}
+
+        out = []
+        for i, r in enumerate(rows):
+            exp = int(r.get("exp") or 0)
+            row = {
+                "email": r["email"].strip().lower(),
+                "password_hash": hashed.get(i) or r["password_hash"],
+                "exp": exp,
+                "level": int(r["level"]) if not _blank(r.get("level")) else level_for_exp(exp),
+            }
+            if not _blank(r.get("progress")):
+                bits = str(r["progress"]).strip()
+                if not all(c in "01" for c in bits):
+                    raise ValueError(f"user {row['email']!r}: invalid progress format: {bits!r}")
+                if len(bits) > MAX_BITS:
+                    raise ValueError(f"user {row['email']!r}: progress is limited to {MAX_BITS} flags")
+                row["progress_bits"], row["progress_len"] = from_bitstring(bits), len(bits)
+            out.append(row)
+        return out
+
+    def _index_flags(self, conn: Connection, values: list[dict]) -> None:
+        """progress 付きで入れたユーザーのフラグを user_progress_flags にも入れる"""
+        bits = {v["email"]: v["progress_bits"] for v in values if v.get("progress_bits")}
+        ids = self._resolver.user_ids(conn, bits)
+        rows = [row for email, user_id in ids.items() for row in progress_flags.flag_rows(user_id, bits[email])]
+        if rows:
+            conn.execute(progress_flags.insert_stmt(conn.dialect.name, rows))
+
+    def _progress(self, conn: Connection, rows: list[dict]) -> list[dict]:
+        ids = self._resolver.user_ids(conn, (r["email"].strip().lower() for r in rows if _blank(r.get("user_id"))))
+        now = datetime.now(timezone.utc)
+        out = []
+        for r in rows:
+            if not _blank(r.get("user_id")):
+                user_id = int(r["user_id"])
+            else:
+                email = r["email"].strip().lower()
+                if email not in ids:
+                    raise ValueError(f"unknown user: {email!r}")
+                user_id = ids[email]
+            cleared_at = datetime.fromisoformat(r["cleared_at"]) if not _blank(r.get("cleared_at")) else now
+            out.append({"user_id": user_id, "step_id": int(r["step_id"]), "is_cleared": True, "cleared_at": cleared_at})
+        return out
+
+    KINDS: dict[str, tuple] = {
+        "topics": (Topic, "_topics"),
+        "steps": (Step, "_steps"),
+        "users": (User, "_users"),
+        "progress": (UserStepProgress, "_progress"),
+    }
+
+    def load(self, kind: str, rows: Iterable[dict], report: Callable[[int, float], None]) -> tuple[int, int]:
+        """(読んだ行数, 実際に入った行数) を返す"""
+        entity, convert_name = self.KINDS[kind]
+        convert = getattr(self, convert_name)
+        it = iter(rows)
+        read = inserted = 0
+        start = time.perf_counter()
+        while True:
+            chunk = list(itertools.islice(it, self.chunk_size))
+            if not chunk:
+                break
+            # 1 チャンク = 1 トランザクション
+            with engine.begin() as conn:
+                values = convert(conn, chunk)
+                if values:
+                    if self.on_conflict == "ignore":
+                        stmt = insert_ignore_stmt(conn.dialect.name, entity, values)
+                    else:
+                        stmt = insert(entity).values(values)
+                    inserted += conn.execute(stmt).rowcount
+                    if entity is User:
+                        self._index_flags(conn, values)
+            read += len(chunk)
+            report(read, time.perf_counter() - start)
+        return read, inserted
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="CSV / JSONL からの一括投入")
+    parser.add_argument("kind", choices=sorted(Loader.KINDS))
+    parser.add_argument("path", help='入力ファイル（"-" で標準入力）')
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="省略時は拡張子から判断")
+    parser.add_argument("--chunk", type=int, default=1000, help="1 文・1 トランザクションあたりの行数")
+    parser.add_argument("--on-conflict", choices=["error", "ignore"], default="error",
+                        help="ignore なら一意制約にぶつかる行（既存のメールアドレス等）を飛ばす")
+    parser.add_argument("--hash-workers", type=int, default=0, help="パスワードハッシュに使うプロセス数")
+    args = parser.parse_args(argv)
+
+    def report(read: int, elapsed: float) -> None:
+        print(f"\r  {args.kind}: {read} 行 ({read / elapsed:.0f} 行/秒)", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    with Loader(args.chunk, args.on_conflict, args.hash_workers) as loader:
+        try:
+            read, inserted = loader.load(args.kind, read_rows(args.path, args.format), report)
+        except IntegrityError as e:
+            print(file=sys.stderr)
+            sys.exit(f"❌ 一意制約に違反する行があります（--on-conflict ignore で飛ばせます）: {e.orig}")
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print(f"✅ {args.kind}: {inserted}/{read} 行を投入しました "
+          f"({elapsed:.1f} 秒, {read / elapsed if elapsed else 0:.0f} 行/秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,36 @@
+"""
+テーブルを作成する（既にあるテーブルはそのまま）
+
+    python -m app.db.init_db
+
+既存のテーブルに後から足した列・インデックスは create_all では作られないので、最後に不足分を表示する。
+進捗フラグの索引（user_progress_flags）が空なら users.progress_bits から作る
+"""
+from sqlalchemy import select
+
 from app.db.base import Base, engine
 from app.db import models  # noqa: F401 (import for side-effects)
-print("Creating tables ...")
-Base.metadata.create_all(bind=engine)
-print("Done.")
+from app.db import progress_flags
+from app.db.schema import diff_schema
+
+
+def init_db() -> list[str]:
+    """テーブルを作成し、なお足りないもの（diff_schema の結果）を返す"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if conn.execute(select(models.UserProgressFlag.user_id).limit(1)).first() is None:
+            progress_flags.backfill(conn)
+    with engine.connect() as conn:
+        return diff_schema(conn)
+
+
+def main() -> None:
+    print("Creating tables ...")
+    problems = init_db()
+    for problem in problems:
+        print(f"  {problem}")
+    print("Done." if not problems else "Done (schema differs from the models, see above).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 from typing import Optional
-from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, UniqueConstraint, func
+from sqlalchemy import String, Integer, SmallInteger, BigInteger, Boolean, DateTime, ForeignKey, UniqueConstraint, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db.base import Base
+from app.core.bitset import to_bitstring
 
 class User(Base):
     __tablename__ = "users"
@@ -14,7 +15,27 @@ class User(Base):
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     progresses: Mapped[list["UserStepProgress"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    progress: Mapped[str] = mapped_column(String(255), default="0000", nullable=False)
+    # 進捗フラグ: i 文字目のフラグを i ビット目に持つビットマップと、その長さ（最大 63）
+    progress_bits: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    progress_len: Mapped[int] = mapped_column(Integer, default=4, nullable=False)
+
+    @property
+    def progress(self) -> str:
+        """API 向けの '0'/'1' 文字列表現（例: "0110"）"""
+        return to_bitstring(self.progress_bits, self.progress_len)
+
+# ランキング用の複合インデックス（並び順 level DESC, exp DESC, id ASC と一致させる）
+Index("ix_users_ranking", User.level.desc(), User.exp.desc(), User.id)
+
+class UserProgressFlag(Base):
+    """
+    users.progress_bits で立っているフラグ 1 つにつき 1 行（app/db/progress_flags.py で同期する）。
+    ビット演算の条件はインデックスを使えないので、「index 番目が立っているユーザー」は
+    主キー (flag_index, user_id) を id 順に辿って引く
+    """
+    __tablename__ = "user_progress_flags"
+    flag_index: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
 
 class VerificationCode(Base):
     """
@@ -23,11 +44,14 @@ class VerificationCode(Base):
     """
     __tablename__ = "verification_codes"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    email: Mapped[str] = mapped_column(String(255), index=True, nullable=False)
+    email: Mapped[str] = mapped_column(String(255), nullable=False)
     code_hash: Mapped[str] = mapped_column(String(255), nullable=False)
-    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # 期限切れの掃除（app/core/sweeper.py）で使う
+    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
     attempts_left: Mapped[int] = mapped_column(Integer, default=3, nullable=False)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # (email, created_at) の複合インデックスを兼ねる。
+    # verify の WHERE email = ? ORDER BY created_at DESC LIMIT 1 はこれを逆順に読むだけで済む
     __table_args__ = (UniqueConstraint("email", "created_at", name="uq_email_created_at"),)
 
 class Topic(Base):
@@ -50,9 +74,24 @@ class Step(Base):
 class UserStepProgress(Base):
     __tablename__ = "user_step_progress"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    # user_id 単体の検索は uq_user_step の先頭列で賄えるので個別インデックスは張らない
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     step_id: Mapped[int] = mapped_column(ForeignKey("steps.id", ondelete="CASCADE"), index=True)
     is_cleared: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     cleared_at: Mapped[Optional[DateTime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
     user: Mapped["User"] = relationship(back_populates="progresses")
+
+    __table_args__ = (UniqueConstraint("user_id", "step_id", name="uq_user_step"),)
+
+class ClientEvent(Base):
+    """
+    /progress/batch で適用済みのクライアントイベント（冪等キー）。
+    同じキーの再送は適用せずに "duplicate" として返す。
+    """
+    __tablename__ = "client_events"
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key: Mapped[str] = mapped_column(String(64), nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_client_event"),)
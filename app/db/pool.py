@@ -0,0 +1,146 @@
+"""
+コネクションプールの設定と統計
+
+- プールサイズ・オーバーフロー・recycle・timeout は Settings から渡す
+- pre-ping は DB_POOL_PRE_PING で切り替える
+    always: チェックアウトごとに ping（SQLAlchemy の pool_pre_ping と同じ）
+    idle:   DB_POOL_PING_IDLE_SEC 以上使われていなかった接続だけ ping
+    never:  ping しない（切断検知は recycle と実行時エラーに任せる）
+- チェックアウト待ち時間・オーバーフロー等を PoolStats に集計し /health/pool で返す
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+
+@dataclass
+class PoolStats:
+    connects: int = 0
+    checkouts: int = 0
+    checkins: int = 0
+    invalidations: int = 0
+    pings: int = 0
+    ping_failures: int = 0
+    timeouts: int = 0
+    wait_count: int = 0
+    wait_total_sec: float = 0.0
+    wait_max_sec: float = 0.0
+    overflow_peak: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_wait(self, elapsed: float, overflow: int) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total_sec += elapsed
+            if elapsed > self.wait_max_sec:
+                self.wait_max_sec = elapsed
+            if overflow > self.overflow_peak:
+                self.overflow_peak = overflow
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg = self.wait_total_sec / self.wait_count if self.wait_count else 0.0
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(avg * 1000, 3),
+                "wait_max_ms": round(self.wait_max_sec * 1000, 3),
+                "overflow_peak": self.overflow_peak,
+            }
+
+
+# API（非同期エンジン）側のプール統計
+pool_stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """_do_get（プールからの取り出し）にかかった時間を pool_stats に記録する"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start, max(self.overflow(), 0))
+
+
+def pool_options(url: str, *, is_async: bool) -> dict:
+    """create_engine / create_async_engine に渡すプール関連の引数"""
+    if url.startswith("sqlite"):
+        # SQLite はファイル/メモリ DB なのでサイズ調整も ping も不要
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else QueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING == "always",
+    }
+
+
+def instrument(engine: Engine, stats: PoolStats = pool_stats) -> None:
+    """プールイベントを stats に集計し、idle 戦略の ping を仕込む"""
+    idle_sec = settings.DB_POOL_PING_IDLE_SEC
+    ping_idle = settings.DB_POOL_PRE_PING == "idle" and not engine.url.drivername.startswith("sqlite")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+        if not ping_idle:
+            return
+        idle_for = time.monotonic() - connection_record.info.get("checked_in_at", 0.0)
+        if idle_for < idle_sec:
+            return
+        stats.pings += 1
+        try:
+            ok = engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            ok = False
+        if not ok:
+            stats.ping_failures += 1
+            # DisconnectionError を投げるとプールが接続を作り直して再試行する
+            raise exc.DisconnectionError("stale connection detected by idle ping")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        stats.checkins += 1
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
+
+
+def pool_status(engine: Engine, stats: PoolStats = pool_stats) -> dict:
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__, **stats.snapshot()}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "timeout_sec": settings.DB_POOL_TIMEOUT,
+        })
+    return status
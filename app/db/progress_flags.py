@@ -0,0 +1,66 @@
+"""
+進捗フラグの索引（user_progress_flags）の同期
+
+users.progress_bits を更新する箇所は、同じトランザクションで立った / 落ちたフラグをここに反映する。
+- apply_mask(): progress_bits = (progress_bits | set_mask) & keep_mask に合わせる
+  （更新前の値に関係なく結果が決まるので、行を読まずに DELETE ... IN / INSERT IGNORE だけで済む）
+- flag_rows() / insert_stmt(): write-behind の反映や一括投入など、まとめて立てる側向け
+- backfill(): 既存の users から作り直す（python -m app.db.init_db が索引が空のときに呼ぶ）
+"""
+from typing import Iterable
+
+from sqlalchemy import delete, literal, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.bitset import MAX_BITS, full_mask
+from app.db.atomic import insert_ignore, insert_ignore_stmt
+from app.db.models import User, UserProgressFlag
+
+_CONFLICT = ["flag_index", "user_id"]
+
+
+def indices_of(mask: int) -> list[int]:
+    return [i for i in range(MAX_BITS) if mask >> i & 1]
+
+
+def flag_rows(user_id: int, mask: int) -> list[dict]:
+    return [{"flag_index": i, "user_id": user_id} for i in indices_of(mask)]
+
+
+def insert_stmt(dialect: str, rows: Iterable[dict]):
+    """既に立っているフラグは無視して rows を入れる文（rows が空でないこと）"""
+    return insert_ignore_stmt(dialect, UserProgressFlag, list(rows), _CONFLICT)
+
+
+async def apply_mask(db: AsyncSession, user_id: int, set_mask: int, keep_mask: int) -> None:
+    cleared = full_mask() & ~keep_mask
+    if cleared:
+        await db.execute(
+            delete(UserProgressFlag)
+              .where(UserProgressFlag.user_id == user_id, UserProgressFlag.flag_index.in_(indices_of(cleared)))
+              .execution_options(synchronize_session=False)
+        )
+    await insert_ignore(db, UserProgressFlag, flag_rows(user_id, set_mask & keep_mask), conflict=_CONFLICT)
+
+
+async def replace(db: AsyncSession, user_id: int, bits: int) -> None:
+    """progress_bits を bits で上書きしたときの同期"""
+    await apply_mask(db, user_id, bits, bits)
+
+
+def backfill(conn: Connection) -> int:
+    """users.progress_bits から索引を作る（フラグごとに INSERT ... SELECT 1 文）。入れた行数を返す"""
+    dialect = conn.dialect.name
+    total = 0
+    for i in range(MAX_BITS):
+        source = select(literal(i), User.id).where(User.progress_bits.op("&")(1 << i) != 0)
+        if dialect == "sqlite":
+            stmt = sqlite.insert(UserProgressFlag).from_select(_CONFLICT, source).on_conflict_do_nothing()
+        elif dialect == "postgresql":
+            stmt = postgresql.insert(UserProgressFlag).from_select(_CONFLICT, source).on_conflict_do_nothing()
+        else:
+            stmt = mysql.insert(UserProgressFlag).from_select(_CONFLICT, source).prefix_with("IGNORE")
+        total += conn.execute(stmt).rowcount
+    return total
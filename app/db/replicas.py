@@ -0,0 +1,205 @@
+"""
+読み取りレプリカへの振り分け
+
+DB_REPLICA_URLS に並べたレプリカ（DATABASE_URL と同じ形式）ごとに非同期エンジンを作り、
+読み取り専用のハンドラ（deps.get_read_db を使うもの）のセッションを健全なレプリカへ順番に振る。
+- DB_REPLICA_HEALTH_SEC ごとに SELECT 1（MySQL ではレプリケーションの遅れ）を確認し、
+  失敗したものと DB_REPLICA_MAX_LAG_SEC より遅れているものには振らない。リクエスト中に接続が切れたものも外す
+  （セッションを渡す前に接続できなかった場合は、次のレプリカか primary で読み直す）
+- 健全なレプリカが無い、または DB_REPLICA_URLS が空なら primary（app.db.base.async_engine）を使う
+- read-your-writes: events.user_changed() を受けたユーザーは DB_REPLICA_STICKY_SEC の間 primary から読む。
+  対象のユーザーはパスの user_id とクッキーのログインユーザー（セッションを作る前に決める）
+- 書き込みの記録はプロセス内なので、別ワーカーで書き込んだ直後の読み取りはレプリカに行くことがある
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core import events
+from app.core.cache import TTLCache
+from app.core.config import settings, to_async_url
+from app.db.base import AsyncSessionLocal
+from app.db.pool import PoolStats, instrument, pool_options, pool_status
+
+logger = logging.getLogger("app.replicas")
+
+# 直前に書き込んだユーザーを覚えておく上限（溢れた分はレプリカから読まれるだけ）
+_STICKY_MAX_USERS = 100_000
+
+
+class Replica:
+    def __init__(self, url: str) -> None:
+        self.name = make_url(url).render_as_string(hide_password=True)
+        async_url = to_async_url(url)
+        self.engine: AsyncEngine = create_async_engine(async_url, **pool_options(async_url, is_async=True))
+        self.stats = PoolStats()
+        instrument(self.engine.sync_engine, self.stats)
+        self.sessions = async_sessionmaker(
+            bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+        self.healthy = True
+        self.lag_sec: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.reads = 0
+
+    def mark_down(self, reason: str) -> None:
+        if self.healthy:
+            logger.warning("replica %s marked down: %s", self.name, reason)
+        self.healthy = False
+        self.last_error = reason
+
+    async def check(self, max_lag_sec: float) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag = await _replication_lag(conn)
+        except Exception as e:
+            self.mark_down(f"{type(e).__name__}: {getattr(e, 'orig', None) or e}")
+            return
+        finally:
+            self.checked_at = time.time()
+        self.lag_sec = lag
+        if lag is None:
+            self.mark_down("replication is not running")
+        elif lag > max_lag_sec:
+            self.mark_down(f"lag {lag:.1f}s > {max_lag_sec:.1f}s")
+        else:
+            if not self.healthy:
+                logger.info("replica %s is back (lag %.1fs)", self.name, lag)
+            self.healthy = True
+            self.last_error = None
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_sec": self.lag_sec,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at,
+            "reads": self.reads,
+            "pool": pool_status(self.engine.sync_engine, self.stats),
+        }
+
+
+async def _replication_lag(conn) -> Optional[float]:
+    """レプリケーションの遅れ（秒）。停止中なら None、レプリカでない（検証用の単体 DB）なら 0"""
+    if conn.dialect.name != "mysql":
+        await conn.execute(text("SELECT 1"))
+        return 0.0
+    try:
+        row = (await conn.execute(text("SHOW REPLICA STATUS"))).mappings().first()
+    except exc.DBAPIError:
+        # 8.0.22 より前の MySQL
+        row = (await conn.execute(text("SHOW SLAVE STATUS"))).mappings().first()
+    if row is None:
+        return 0.0
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list[str], health_sec: float, max_lag_sec: float, sticky_sec: float) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.health_sec = health_sec
+        self.max_lag_sec = max_lag_sec
+        self.sticky_sec = sticky_sec
+        self._next = itertools.count()
+        self._recent_writes = TTLCache(maxsize=_STICKY_MAX_USERS, ttl=sticky_sec)
+        self._task: Optional[asyncio.Task] = None
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    # --- read-your-writes ---
+
+    def note_write(self, user_id: int) -> None:
+        self._recent_writes.set(user_id, True)
+
+    def recently_wrote(self, user_id: int) -> bool:
+        return self._recent_writes.get(user_id) is not None
+
+    # --- 振り分け ---
+
+    def pick(self) -> Optional[Replica]:
+        """健全なレプリカを順番に返す（無ければ None）"""
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+        return None
+
+    def session(self, *user_ids: Optional[int]) -> tuple[AsyncSession, Optional[Replica]]:
+        """
+        読み取り用のセッションと、それが向いているレプリカ（primary なら None）。
+        user_ids のどれかが直前に書き込んでいれば primary を使う
+        """
+        if self.enabled:
+            if any(uid is not None and self.recently_wrote(uid) for uid in user_ids):
+                self.sticky_reads += 1
+            else:
+                replica = self.pick()
+                if replica is not None:
+                    replica.reads += 1
+                    return replica.sessions(), replica
+        self.primary_reads += 1
+        return AsyncSessionLocal(), None
+
+    # --- ヘルスチェック ---
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(replica.check(self.max_lag_sec) for replica in self.replicas))
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="replica-health-check")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*(replica.engine.dispose() for replica in self.replicas))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_sec)
+            try:
+                await self.check_all()
+            except Exception:
+                logger.exception("replica health check failed")
+
+    def status(self) -> dict:
+        return {
+            "replicas": [replica.status() for replica in self.replicas],
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+            "sticky_sec": self.sticky_sec,
+        }
+
+
+replica_router = ReplicaRouter(
+    urls=settings.DB_REPLICA_URLS,
+    health_sec=settings.DB_REPLICA_HEALTH_SEC,
+    max_lag_sec=settings.DB_REPLICA_MAX_LAG_SEC,
+    # 書き込みがレプリカに届くまで（write-behind の反映待ち + 許容する遅れ）は primary から読む
+    sticky_sec=max(
+        settings.DB_REPLICA_STICKY_SEC,
+        settings.DB_REPLICA_MAX_LAG_SEC + (settings.WRITE_BEHIND_FLUSH_SEC if settings.WRITE_BEHIND_ENABLED else 0),
+    ),
+)
+
+
+@events.subscribe
+def _on_user_changed(event: events.UserChanged) -> None:
+    if replica_router.enabled:
+        replica_router.note_write(event.user_id)
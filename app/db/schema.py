@@ -0,0 +1,40 @@
+"""
+モデル定義（Base.metadata）と実際の DB スキーマの突き合わせ
+
+テーブル・列・名前付きのインデックス / 一意制約が DB にあるかだけを見る（型や並び順までは比べない）。
+create_all は既存のテーブルにインデックスや列を足さないので、後から足したものの入れ忘れをここで見つける。
+起動時（app/core/startup.py）と python -m app.db.init_db から使う。
+"""
+from sqlalchemy import UniqueConstraint, inspect
+from sqlalchemy.engine import Connection
+
+from app.db.base import Base
+from app.db import models  # noqa: F401 (import for side-effects)
+
+
+def diff_schema(conn: Connection) -> list[str]:
+    """足りないテーブル・列・インデックスを文字列のリストで返す（空ならモデルどおり）"""
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    problems = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            problems.append(f"missing table {table.name}")
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        problems += [
+            f"missing column {table.name}.{column.name}"
+            for column in table.columns
+            if column.name not in columns
+        ]
+        # MySQL は一意制約もインデックスとして返し、SQLite は別々に返すので両方まとめて見る
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        indexes |= {u["name"] for u in inspector.get_unique_constraints(table.name)}
+        expected = [i.name for i in table.indexes]
+        expected += [c.name for c in table.constraints if isinstance(c, UniqueConstraint)]
+        problems += [
+            f"missing index {table.name}.{name}"
+            for name in expected
+            if name and name not in indexes
+        ]
+    return problems
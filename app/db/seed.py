@@ -17,8 +17,7 @@ def seed():
                 description="HTMLの見出し色変更→add→commit→push"
             )
             db.add(topic)
-            db.commit()
-            db.refresh(topic)
+            db.flush()
             print(f"✅ お題 '{topic_title}' を作成しました (id={topic.id})")
 
         # --- ステップの存在チェック ---
@@ -29,19 +28,19 @@ def seed():
             (4, "プッシュ（git push）", 25),
         ]
 
+        # 既存のステップは 1 回でまとめて引き、足りない分だけ追加して最後に 1 回だけコミットする
+        existing = {
+            step.order_no: step
+            for step in db.query(Step).filter(Step.topic_id == topic.id)
+        }
         for order_no, title, xp in steps_data:
-            step = (
-                db.query(Step)
-                .filter(Step.topic_id == topic.id, Step.order_no == order_no)
-                .first()
-            )
+            step = existing.get(order_no)
             if step:
                 print(f"  ⚠️ ステップ {order_no} '{title}' は既に存在します (id={step.id})")
             else:
-                step = Step(topic_id=topic.id, order_no=order_no, title=title, xp_reward=xp)
-                db.add(step)
-                db.commit()
+                db.add(Step(topic_id=topic.id, order_no=order_no, title=title, xp_reward=xp))
                 print(f"  ✅ ステップ {order_no} '{title}' を追加しました")
+        db.commit()
 
     finally:
         db.close()
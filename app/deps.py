@@ -1,9 +1,50 @@
-from typing import Generator
-from app.db.base import SessionLocal
+from typing import AsyncGenerator, Optional
+from fastapi import Request
+from jose import JWTError
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.authcache import decode_access_token
+from app.core.security import COOKIE_NAME
+from app.db.base import AsyncSessionLocal
+from app.db.replicas import replica_router
 
-def get_db() -> Generator:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def _cookie_user_id(request: Request) -> Optional[int]:
+    """クッキーのログインユーザー。無い・不正なら None（認証自体はハンドラ側で行う）"""
+    token = request.cookies.get(COOKIE_NAME)
+    if not token:
+        return None
+    try:
+        return int(decode_access_token(token).get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    読み取り専用のハンドラ用のセッション。レプリカがあれば順番に振り分ける。
+    パスの user_id かクッキーのログインユーザーが直前に書き込んでいれば primary から読む（read-your-writes）
+    ハンドラの途中で接続が切れた場合は、そのレプリカを外して 5xx を返す（読み直しはしない）
+    """
+    user_id = request.path_params.get("user_id")
+    user_ids = (int(user_id) if user_id and user_id.isdigit() else None, _cookie_user_id(request))
+    db, replica = replica_router.session(*user_ids)
+    # レプリカには先に接続しておき、繋がらなければ外して次のレプリカ（無ければ primary）で読む
+    while replica is not None:
+        try:
+            await db.connection()
+            break
+        except exc.DBAPIError as e:
+            await db.close()
+            replica.mark_down(f"{type(e).__name__}: {e.orig}")
+            db, replica = replica_router.session(*user_ids)
+    async with db:
+        try:
+            yield db
+        except exc.DBAPIError as e:
+            # 接続が切れたレプリカは次のヘルスチェックで戻るまで外す
+            if replica is not None and (e.connection_invalidated or isinstance(e, exc.OperationalError)):
+                replica.mark_down(f"{type(e).__name__}: {e.orig}")
+            raise
@@ -1,30 +1,49 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.routers import auth, twofa, progress, ranking, gitsim
-import logging
-import sys
-
-# ロギング設定
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.StreamHandler(sys.stderr)
-    ]
-)
-
-# 主要なロガーのログレベルを設定
-for logger_name in ['uvicorn', 'uvicorn.access', 'uvicorn.error', 'fastapi']:
-    logging.getLogger(logger_name).setLevel(logging.DEBUG)
+from app.core.logconfig import setup_logging
+from app.core.hasher import hash_pool
+from app.core.emailer import dispatcher as mail_dispatcher
+from app.core.sweeper import sweeper
+from app.core.writebehind import write_behind
+from app.core import metrics, profiler, startup
+from app.core.compression import CompressionMiddleware
+from app.db.base import async_engine
+from app.db.pool import pool_status
+from app.db.replicas import replica_router
+from app.routers import auth, twofa, progress, ranking, gitsim, topics, live, debug
 
-# アプリケーション固有のロガーを設定
-app_logger = logging.getLogger('app')
-app_logger.setLevel(logging.DEBUG)
-app_logger.info('アプリケーションのログ設定を初期化しました')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report = startup.report
+    report.begin()
+    with report.phase("logging"):
+        # ロギング設定（レベル・形式は Settings の LOG_* で指定）
+        setup_logging()
+    # DB 接続・スキーマ確認・キャッシュ・bcrypt の準備をトラフィックを受ける前に済ませる（app/core/startup.py）
+    await startup.warm_up()
+    with report.phase("background"):
+        if settings.mail_backend == "queued":
+            mail_dispatcher.start()
+        sweeper.start()
+        write_behind.start()
+        replica_router.start()
+    report.finish(settings.STARTUP_BUDGET_SEC)
+    try:
+        yield
+    finally:
+        # 溜まっている exp / フラグはエンジンを閉じる前に反映する
+        await write_behind.stop()
+        await sweeper.stop()
+        await mail_dispatcher.stop()
+        hash_pool.shutdown()
+        await replica_router.stop()
+        await async_engine.dispose()
 
-app = FastAPI(title=settings.APP_NAME)
+# JSON は orjson で書き出す（jsonable_encoder + 標準 json より速い）
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # フロントが Next.js 等の場合の CORS 設定（必要に応じて調整）
 app.add_middleware(
@@ -33,14 +52,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-SQL-Profile"],
 )
 
+# 一定サイズ以上の応答を gzip / brotli で圧縮する
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    )
+
+# 開発用: リクエストごとの SQL を記録する（計測ミドルウェアより内側）。SQL_PROFILER=true のときだけ /debug も出す
+if profiler.enabled():
+    app.add_middleware(profiler.SQLProfilerMiddleware)
+    profiler.instrument_engine(async_engine.sync_engine)
+    for replica in replica_router.replicas:
+        profiler.instrument_engine(replica.engine.sync_engine)
+    app.include_router(debug.router)
+
+# 最後に追加したものが最も外側になる（CORS のプリフライトも含めて計測する）
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(async_engine.sync_engine)
+    for replica in replica_router.replicas:
+        metrics.instrument_engine(replica.engine.sync_engine)
+
 app.include_router(auth.router)
 app.include_router(twofa.router)
 app.include_router(progress.router)
 app.include_router(ranking.router)
 app.include_router(gitsim.router)
+app.include_router(topics.router)
+app.include_router(live.router)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/health/pool")
+def health_pool():
+    # 内部向け: コネクションプールの使用状況（ワーカー数・プールサイズの調整用）
+    return pool_status(async_engine.sync_engine)
+
+@app.get("/health/replicas")
+def health_replicas():
+    # 内部向け: 読み取りレプリカの状態と振り分け件数
+    return replica_router.status()
+
+@app.get("/health/startup")
+def health_startup():
+    # 内部向け: 直近の起動にかかった時間のフェーズ別内訳
+    return startup.report.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    # Prometheus のテキスト形式。コネクションプールの状態も載せる
+    return PlainTextResponse(
+        metrics.registry.render(pool_status(async_engine.sync_engine), startup.report.snapshot()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
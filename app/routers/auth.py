@@ -1,21 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, status, Request
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from app.schemas.auth import RegisterIn, LoginIn, TokenOut
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from jose import JWTError
+from app.schemas.auth import RegisterIn, LoginIn, MeOut, TokenOut
 from app.db.models import User
-from app.core.security import hash_password, verify_password, create_access_token, ALGORITHM
+from app.core.security import COOKIE_NAME, create_access_token
+from app.core.hasher import hash_password, verify_and_update_password
+from app.core.authcache import Principal, decode_access_token, get_principal, remember_principal
 from app.core.config import settings
-from app.deps import get_db
+from app.core.ratelimit import rate_limit
+from app.deps import get_db, get_read_db
+from app.core import events
 import logging
-import sys
 
-# ロガーの設定
-logger = logging.getLogger("uvicorn.auth")
-logger.setLevel(logging.DEBUG)
+# レベルは Settings の LOG_LEVEL / LOG_LEVELS で決める
+logger = logging.getLogger("app.auth")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-COOKIE_NAME = "sq_token"
 COOKIE_SECURE = False  # 本番は True + HTTPS
 COOKIE_HTTPONLY = True
 COOKIE_SAMESITE = "lax"
@@ -34,39 +37,52 @@ def set_auth_cookie(response: Response, token: str) -> None:
     )
 
 @router.post("/register", response_model=TokenOut)
-def register(payload: RegisterIn, response: Response, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == payload.email).first():
+async def register(payload: RegisterIn, response: Response, db: AsyncSession = Depends(get_db)):
+    existing = await db.execute(select(User.id).where(User.email == payload.email))
+    if existing.first():
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = User(email=payload.email, password_hash=hash_password(payload.password))
+    # bcrypt は専用のワーカープールで実行する（混雑時は 503）
+    password_hash = await hash_password(payload.password)
+    user = User(email=payload.email, password_hash=password_hash)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    events.user_row_changed(user)
     token = create_access_token(str(user.id))
     set_auth_cookie(response, token)
     return {"access_token": token, "token_type": "bearer"}
 
-@router.post("/login", response_model=TokenOut)
-def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
+# bcrypt 検証より先に弾く
+_login_limit = rate_limit("login", settings.LOGIN_RATE_PER_IP, settings.LOGIN_RATE_PER_EMAIL)
+
+@router.post("/login", response_model=TokenOut, dependencies=[Depends(_login_limit)])
+async def login(payload: LoginIn, response: Response, db: AsyncSession = Depends(get_db)):
     try:
-        logger.info(f"[Auth] 👤 ログインリクエスト受信: email={payload.email}")
+        logger.debug("[Auth] 👤 ログインリクエスト受信: email=%s", payload.email)
         
         # ユーザー検索
-        user = db.query(User).filter(User.email == payload.email).first()
+        result = await db.execute(select(User).where(User.email == payload.email))
+        user = result.scalars().first()
         if not user:
-            logger.warning(f"[Auth] ❌ ユーザーが見つかりません: {payload.email}")
+            logger.warning("[Auth] ❌ ユーザーが見つかりません: %s", payload.email)
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # パスワード検証
-        if not verify_password(payload.password, user.password_hash):
-            logger.warning(f"[Auth] ❌ パスワードが一致しません: {payload.email}")
+        verified, new_hash = await verify_and_update_password(payload.password, user.password_hash)
+        if not verified:
+            logger.warning("[Auth] ❌ パスワードが一致しません: %s", payload.email)
             raise HTTPException(status_code=401, detail="Invalid credentials")
+
+        # BCRYPT_ROUNDS が変わっていれば新しいコストのハッシュに置き換える
+        if new_hash:
+            logger.info("[Auth] 🔁 パスワードハッシュを更新: user_id=%s", user.id)
+            user.password_hash = new_hash
+            await db.commit()
         
         # トークン生成
-        logger.info(f"[Auth] 🔑 トークン生成: user_id={user.id}")
         token = create_access_token(str(user.id))
         
         # クッキー設定
-        logger.info(f"[Auth] 🍪 クッキー設定: user_id={user.id}")
         response.set_cookie(
             COOKIE_NAME, 
             token, 
@@ -75,37 +91,46 @@ def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
             samesite=COOKIE_SAMESITE
         )
         
-        logger.info(f"[Auth] ✅ ログイン成功: user_id={user.id}")
-        print(f"[Auth Console] ✅ ログイン成功: email={payload.email}, user_id={user.id}", flush=True)
+        logger.info("[Auth] ✅ ログイン成功: user_id=%s", user.id)
         
         return {"access_token": token, "token_type": "bearer"}
         
     except HTTPException as he:
         # 既知のエラーは再送
         raise he
-    except Exception as e:
+    except Exception:
         # 予期しないエラー
-        error_msg = f"[Auth] ❌ ログイン処理中にエラーが発生: {str(e)}"
-        logger.error(error_msg)
-        print(error_msg, file=sys.stderr, flush=True)
+        logger.exception("[Auth] ❌ ログイン処理中にエラーが発生")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+async def _load_principal(user_id: int, db: AsyncSession) -> Principal | None:
+    # キャッシュに無いときだけ users を引く
+    principal = get_principal(user_id)
+    if principal is None:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        principal = remember_principal(user)
+    return principal
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> Principal:
+    return await _authenticate(request, db)
+
+async def get_current_reader(request: Request, db: AsyncSession = Depends(get_read_db)) -> Principal:
+    """get_current_user と同じ。読み取り専用のハンドラ向けに、ユーザーはレプリカから引く"""
+    return await _authenticate(request, db)
+
+async def _authenticate(request: Request, db: AsyncSession) -> Principal:
     try:
-        logger.debug(f"[Auth] 🔒 認証チェック開始")
-        logger.debug(f"[Auth] 📝 リクエストヘッダー: {dict(request.headers)}")
-        logger.debug(f"[Auth] 🍪 リクエストクッキー: {request.cookies}")
-        
         token = request.cookies.get(COOKIE_NAME)
         if not token:
-            logger.warning("[Auth] ❌ トークンが見つかりません")
+            logger.debug("[Auth] ❌ トークンが見つかりません")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Not authenticated"
             )
             
-        logger.debug(f"[Auth] 🎟 トークン検証開始")
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("sub")
         
         if user_id is None:
@@ -116,64 +141,56 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
             )
             
         # ユーザーの取得
-        user = db.query(User).filter(User.id == int(user_id)).first()
+        user = await _load_principal(int(user_id), db)
         if not user:
-            logger.warning(f"[Auth] ❌ ユーザーが見つかりません: ID={user_id}")
+            logger.warning("[Auth] ❌ ユーザーが見つかりません: ID=%s", user_id)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found"
             )
             
-        logger.info(f"[Auth] ✅ 認証成功: user_id={user_id}")
+        logger.debug("[Auth] ✅ 認証成功: user_id=%s", user_id)
         return user
         
+    except HTTPException:
+        raise
     except JWTError as e:
-        logger.error(f"[Auth] ❌ トークン検証エラー: {str(e)}")
+        logger.info("[Auth] ❌ トークン検証エラー: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials"
         )
-    except Exception as e:
-        logger.error(f"[Auth] ❌ 認証処理中のエラー: {str(e)}")
+    except SQLAlchemyError:
+        # DB の障害は 401（ログアウト扱い）にしない。get_read_db がレプリカを外せるようにそのまま投げる
+        raise
+    except Exception:
+        logger.exception("[Auth] ❌ 認証処理中のエラー")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication error"
         )
 
-@router.get("/me")
-async def get_me(user: User = Depends(get_current_user)):
-    logger.info(f"[Auth] 👤 ユーザー情報取得: id={user.id}")
+@router.get("/me", response_model=MeOut)
+async def get_me(user: Principal = Depends(get_current_reader)):
+    logger.debug("[Auth] 👤 ユーザー情報取得: id=%s", user.id)
     return {
         "id": user.id,
         "email": user.email,
         "exp": user.exp,
         "level": user.level
     }
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
-    return user
 
 # Cookie からユーザーを引く小ユーティリティ
-def current_user_from_cookie(request: Request, db: Session) -> User:
+async def current_user_from_cookie(request: Request, db: AsyncSession) -> Principal:
     token = request.cookies.get(COOKIE_NAME)
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id = int(payload.get("sub"))
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = db.get(User, user_id)
+    user = await _load_principal(user_id, db)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
-
-@router.get("/me")
-def get_me(request: Request, db: Session = Depends(get_db)):
-    user = current_user_from_cookie(request, db)
-    return {"id": user.id, "email": user.email, "level": user.level, "exp": user.exp}
\ No newline at end of file
+    return user
\ No newline at end of file
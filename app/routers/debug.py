@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.core import profiler
+from app.schemas.debug import SQLProfileOut, SQLProfileSummaryOut
+
+# 開発用。SQL プロファイラが有効なときだけ app に登録する
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+@router.get("/sql-profiles", response_model=list[SQLProfileSummaryOut])
+async def list_sql_profiles(limit: int = Query(20, ge=1, le=100), n_plus_1_only: bool = False):
+    """直近のリクエストの概要（新しい順）"""
+    # イベントループ上で動くので、middleware の append と同時に走ることはない
+    rows = []
+    for profile in reversed(profiler.recent):
+        suspects = profile.n_plus_one()
+        if n_plus_1_only and not suspects:
+            continue
+        rows.append({
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "status": profile.status,
+            "duration_ms": round(profile.duration_ms, 3),
+            "queries": len(profile.statements),
+            "db_ms": round(profile.db_ms, 3),
+            "n_plus_1": len(suspects),
+            "profiled": profile.profile is not None,
+        })
+        if len(rows) >= limit:
+            break
+    return rows
+
+@router.get("/sql-profiles/{profile_id}", response_model=SQLProfileOut)
+async def get_sql_profile(profile_id: int):
+    profile = profiler.find(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.to_dict()
@@ -1,76 +1,176 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.models import User
-from app.deps import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import User, UserProgressFlag
+from app.db.atomic import increment_exp, update_returning
+from app.db import progress_flags
+from app.deps import get_db, get_read_db
+from app.core import events
+from app.core.writebehind import write_behind
+from app.core.bitset import MAX_BITS, from_bitstring, full_mask, mask_of, to_bitstring
+from app.schemas.progress import CompletedUsersOut, ExpOut, ProgressBitsIn, ProgressOut
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 # --- 経験値 API ---
-@router.get("/{user_id}/exp")
-def get_exp(user_id: int, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
+@router.get("/{user_id}/exp", response_model=ExpOut)
+async def get_exp(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    exp = await db.scalar(select(User.exp).where(User.id == user_id))
+    if exp is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"user_id": user.id, "exp": user.exp}
+    return {"user_id": user_id, "exp": exp + write_behind.pending_exp(user_id)}
 
-@router.put("/{user_id}/exp")
-def update_exp(user_id: int, amount: int, db: Session = Depends(get_db)):
+@router.put("/{user_id}/exp", response_model=ExpOut)
+async def update_exp(user_id: int, amount: int, db: AsyncSession = Depends(get_db)):
     """
     経験値を加算/減算する
     amount=10 → exp +10
     amount=-5 → exp -5
     """
-    user = db.get(User, user_id)
-    if not user:
+    if write_behind.enabled:
+        # 増減はメモリに溜めて後でまとめて反映する（ここでは行ロックもコミットもしない）
+        row = (await db.execute(select(User.exp, User.level).where(User.id == user_id))).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        write_behind.add_exp(user_id, amount)
+        exp = row.exp + write_behind.pending_exp(user_id)
+        events.user_changed(user_id, exp=exp, level=row.level)
+        return {"user_id": user_id, "exp": exp}
+
+    # SQL 側で exp = exp + amount するので同時リクエストでも加算が失われない
+    updated = await increment_exp(db, user_id, amount, apply_level=False)
+    if updated is None:
         raise HTTPException(status_code=404, detail="User not found")
-    user.exp += amount
-    db.commit()
-    db.refresh(user)
-    return {"user_id": user.id, "exp": user.exp}
+    await db.commit()
+    exp, level = updated
+    events.user_changed(user_id, exp=exp, level=level)
+    return {"user_id": user_id, "exp": exp}
 
 # --- 進捗 API ---
-@router.get("/{user_id}/progress")
-def get_progress(user_id: int, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
-    if not user:
+# 進捗は users.progress_bits のビットマップで持ち、フラグ更新は 1 文の UPDATE で行う
+# （読み込み → 書き換え → 保存 をしないので同時更新でもフラグが消えない）
+
+def _progress_out(user_id: int, bits: int, length: int) -> dict:
+    return {"user_id": user_id, "progress": to_bitstring(bits, length)}
+
+async def _apply_progress_mask(db: AsyncSession, user_id: int, set_mask: int, keep_mask: int, max_index: int) -> dict:
+    """progress_bits = (progress_bits | set_mask) & keep_mask を 1 文で実行する"""
+    # 溜まっているフラグを後から OR されると落としたはずのフラグが戻るので、先に反映する
+    await write_behind.flush_user(user_id)
+    row = await update_returning(
+        db, User,
+        key=[User.id == user_id],
+        when=[User.progress_len > max_index],
+        values={"progress_bits": User.progress_bits.op("|")(set_mask).op("&")(keep_mask)},
+        returning=[User.progress_bits, User.progress_len],
+    )
+    if row is None:
+        # 更新できなかった理由（ユーザー無し / 範囲外）はエラー時だけ調べる
+        exists = await db.scalar(select(User.id).where(User.id == user_id))
+        if exists is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=400, detail="Index out of range")
+    await progress_flags.apply_mask(db, user_id, set_mask, keep_mask)
+    await db.commit()
+    events.user_changed(user_id, progress=to_bitstring(row.progress_bits, row.progress_len))
+    return _progress_out(user_id, row.progress_bits, row.progress_len)
+
+@router.get("/completed/{index}", response_model=CompletedUsersOut)
+async def list_completed_users(
+    index: int,
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    progress の index 番目が "1" のユーザー ID を id 昇順で返す
+    続きは next_after_id を after_id に渡して取得する
+    user_progress_flags の主キー (flag_index, user_id) を辿るので、1 ページの読み取りは limit 行で済む
+    write-behind で未反映のフラグは（反映を待たずに）メモリ上の分を重ねる
+    """
+    if index < 0 or index >= MAX_BITS:
+        raise HTTPException(status_code=400, detail="Index out of range")
+    result = await db.execute(
+        select(UserProgressFlag.user_id)
+          .where(UserProgressFlag.flag_index == index, UserProgressFlag.user_id > after_id)
+          .order_by(UserProgressFlag.user_id)
+          .limit(limit)
+    )
+    user_ids = list(result.scalars())
+    pending = write_behind.users_with_bit(index, after_id)
+    if pending:
+        user_ids = sorted(set(user_ids).union(pending))[:limit]
+    next_after_id = user_ids[-1] if len(user_ids) == limit else None
+    return {"index": index, "user_ids": user_ids, "next_after_id": next_after_id}
+
+@router.get("/{user_id}/progress", response_model=ProgressOut)
+async def get_progress(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    result = await db.execute(
+        select(User.progress_bits, User.progress_len).where(User.id == user_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"user_id": user.id, "progress": user.progress}
+    return _progress_out(user_id, row.progress_bits | write_behind.pending_bits(user_id), row.progress_len)
 
-@router.put("/{user_id}/progress/{index}")
-def update_progress_flag(user_id: int, index: int, db: Session = Depends(get_db)):
+@router.put("/{user_id}/progress/{index}", response_model=ProgressOut)
+async def update_progress_flag(user_id: int, index: int, db: AsyncSession = Depends(get_db)):
     """
     指定インデックス (0始まり) を "1" に変更する
     例: progress="0100", index=2 → "0110"
     """
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if index < 0 or index >= len(user.progress):
+    if index < 0 or index >= MAX_BITS:
         raise HTTPException(status_code=400, detail="Index out of range")
+    if write_behind.enabled:
+        row = (await db.execute(
+            select(User.progress_bits, User.progress_len).where(User.id == user_id)
+        )).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        if index >= row.progress_len:
+            raise HTTPException(status_code=400, detail="Index out of range")
+        write_behind.set_bits(user_id, 1 << index)
+        progress = to_bitstring(row.progress_bits | write_behind.pending_bits(user_id), row.progress_len)
+        events.user_changed(user_id, progress=progress)
+        return {"user_id": user_id, "progress": progress}
+    return await _apply_progress_mask(db, user_id, 1 << index, full_mask(), index)
 
-    progress_list = list(user.progress)
-    progress_list[index] = "1"
-    user.progress = "".join(progress_list)
-
-    db.commit()
-    db.refresh(user)
-    return {"user_id": user.id, "progress": user.progress}
+@router.patch("/{user_id}/progress", response_model=ProgressOut)
+async def update_progress_flags(user_id: int, payload: ProgressBitsIn, db: AsyncSession = Depends(get_db)):
+    """
+    複数インデックスをまとめて "1"（set）/ "0"（clear）にする
+    例: progress="0100", set=[0, 3], clear=[1] → "1001"
+    """
+    indices = payload.set + payload.clear
+    if not indices:
+        return await get_progress(user_id, db)
+    if min(indices) < 0 or max(indices) >= MAX_BITS:
+        raise HTTPException(status_code=400, detail="Index out of range")
+    keep_mask = full_mask() & ~mask_of(payload.clear)
+    return await _apply_progress_mask(db, user_id, mask_of(payload.set), keep_mask, max(indices))
 
-@router.put("/{user_id}/progress")
-def overwrite_progress(user_id: int, new_progress: str, db: Session = Depends(get_db)):
+@router.put("/{user_id}/progress", response_model=ProgressOut)
+async def overwrite_progress(user_id: int, new_progress: str, db: AsyncSession = Depends(get_db)):
     """
     progress を丸ごと上書きする
     例: new_progress="1111"
     """
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     if not all(c in "01" for c in new_progress):
         raise HTTPException(status_code=400, detail="Invalid progress format")
+    if len(new_progress) > MAX_BITS:
+        raise HTTPException(status_code=400, detail=f"Progress is limited to {MAX_BITS} flags")
 
-    user.progress = new_progress
-    db.commit()
-    db.refresh(user)
-    return {"user_id": user.id, "progress": user.progress}
\ No newline at end of file
+    await write_behind.flush_user(user_id)
+    bits = from_bitstring(new_progress)
+    result = await db.execute(
+        update(User)
+          .where(User.id == user_id)
+          .values(progress_bits=bits, progress_len=len(new_progress))
+          .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await progress_flags.replace(db, user_id, bits)
+    await db.commit()
+    events.user_changed(user_id, progress=new_progress)
+    return {"user_id": user_id, "progress": new_progress}
@@ -0,0 +1,68 @@
+import asyncio
+from fastapi import APIRouter, Query, WebSocket, status
+from jose import JWTError
+from sqlalchemy import select
+from app.core.authcache import decode_access_token
+from app.core.bitset import to_bitstring
+from app.core.config import settings
+from app.core.leaderboard import leaderboard
+from app.core.live import Subscriber, hub
+from app.core.writebehind import write_behind
+from app.db.base import AsyncSessionLocal
+from app.db.models import User
+from app.routers.auth import COOKIE_NAME
+
+router = APIRouter(tags=["live"])
+
+def _user_id_of(websocket: WebSocket) -> int | None:
+    token = websocket.cookies.get(COOKIE_NAME)
+    if not token:
+        return None
+    try:
+        return int(decode_access_token(token).get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+
+async def _until_disconnect(websocket: WebSocket) -> None:
+    # クライアントからのメッセージは使わない（切断の検知のためだけに読む）
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@router.websocket("/ws/live")
+async def live(websocket: WebSocket, ranking: int = Query(0, ge=0, le=settings.LIVE_RANKING_MAX)):
+    """
+    自分の level / exp / progress・順位と、ranking > 0 なら上位 ranking 件の変化を送る
+    接続直後に現在の状態を 1 回送り、その後は変化があったときだけ送る（メッセージは type で区別）
+      {"type": "me", "exp": 120, "level": 3}   変わった項目だけ
+      {"type": "rank", "rank": 5}
+      {"type": "ranking", "top": [...]}         GET /ranking と同じ形
+    """
+    user_id = _user_id_of(websocket)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # 接続中ずっと DB 接続を握らないよう、最初の状態を読んだらセッションは閉じる
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(User.level, User.exp, User.progress_bits, User.progress_len).where(User.id == user_id)
+        )).first()
+    if row is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # 順位を送るのでランキングが古ければ読み直す（/ranking と同じく読み直しは同時に 1 回だけ）
+    await leaderboard.ensure_fresh(AsyncSessionLocal)
+
+    await websocket.accept()
+    state = {
+        "level": row.level,
+        "exp": row.exp + write_behind.pending_exp(user_id),
+        "progress": to_bitstring(row.progress_bits | write_behind.pending_bits(user_id), row.progress_len),
+    }
+    sender = asyncio.create_task(hub.serve(Subscriber(websocket, user_id, ranking), state))
+    receiver = asyncio.create_task(_until_disconnect(websocket))
+    # どちらかが終われば（切断 / 遅い受信者として切った）もう片方も止める
+    done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    # 切断後の送信失敗などはここで捨てる
+    await asyncio.gather(*done, *pending, return_exceptions=True)
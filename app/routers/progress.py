@@ -1,46 +1,250 @@
+import hashlib
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.deps import get_db
 from app.schemas.auth import StepCompleteIn
-from app.db.models import User, Step, UserStepProgress
+from app.schemas.progress import CompleteOut, ProgressBatchIn, ProgressBatchOut, ProgressSummaryOut
+from app.db.models import ClientEvent, Step, Topic, User, UserStepProgress
+from app.db.atomic import increment_exp, insert_ignore, update_returning
+from app.db import progress_flags
+from app.core.bitset import full_mask, mask_of, to_bitstring
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.leveling import exp_for_level, level_for_exp
 from app.routers.auth import current_user_from_cookie
+from app.core import events
+from app.core.catalog import catalog
+from app.core.writebehind import write_behind
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
-def _level_up(user: User) -> None:
-    # シンプルなレベル計算（例）：レベル^2 * 50 を超えたら +1
-    needed = (user.level ** 2) * 50
-    while user.exp >= needed:
-        user.level += 1
-        needed = (user.level ** 2) * 50
-
-@router.post("/complete")
-def complete_step(payload: StepCompleteIn, request: Request, db: Session = Depends(get_db)):
-    user = current_user_from_cookie(request, db)
-    step = db.get(Step, payload.step_id)
+# user_id -> (ETag, /progress/summary の JSON 本文)
+summary_cache = TTLCache(maxsize=settings.SUMMARY_CACHE_SIZE, ttl=settings.SUMMARY_CACHE_TTL_SEC)
+
+@events.subscribe
+def _on_user_changed(event: events.UserChanged) -> None:
+    # クリア・exp・フラグのどれが変わってもサマリーは作り直す
+    summary_cache.pop(event.user_id)
+
+@router.post("/complete", response_model=CompleteOut, response_model_exclude_unset=True)
+async def complete_step(payload: StepCompleteIn, request: Request, db: AsyncSession = Depends(get_db)):
+    principal = await current_user_from_cookie(request, db)
+    # ステップの存在確認と報酬はメモリ上のカタログから引く
+    step = await catalog.get_step(payload.step_id, db)
     if not step:
         raise HTTPException(status_code=404, detail="Step not found")
 
-    prog = (
-        db.query(UserStepProgress)
-          .filter(UserStepProgress.user_id == user.id, UserStepProgress.step_id == step.id)
-          .first()
+    # (user_id, step_id) の一意制約に任せて 1 文で挿入する。
+    # 挿入できなければクリア済み。Cleared と同じく DB の値に未反映の増減を重ねて返す
+    inserted = await insert_ignore(
+        db, UserStepProgress,
+        [{
+            "user_id": principal.id,
+            "step_id": step.id,
+            "is_cleared": True,
+            "cleared_at": datetime.now(timezone.utc),
+        }],
+        conflict=["user_id", "step_id"],
+    )
+    if not inserted:
+        await db.rollback()
+        row = (await db.execute(select(User.exp, User.level).where(User.id == principal.id))).first()
+        if row is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        exp = row.exp + write_behind.pending_exp(principal.id)
+        # 未反映分も含めた exp からレベルを求める（increment_exp と同じくレベルは下げない）
+        level = max(row.level, level_for_exp(exp))
+        return {"message": "Already cleared", "level": level, "exp": exp}
+
+    # exp の加算とレベル計算は SQL 側で行う（同時完了でも加算が失われない）
+    updated = await increment_exp(db, principal.id, step.xp_reward)
+    if updated is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    await db.commit()
+    exp, level = updated
+    exp += write_behind.pending_exp(principal.id)  # まだ反映していない増減も含めて返す
+    events.user_changed(principal.id, exp=exp, level=level)
+
+    return {"message": "Cleared", "level": level, "exp": exp, "reward": step.xp_reward}
+
+
+@router.post("/batch", response_model=ProgressBatchOut)
+async def sync_batch(payload: ProgressBatchIn, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    クライアントに溜まったイベントをまとめて 1 トランザクションで適用する
+    - complete: ステップクリア（クリア済みなら already_cleared、存在しなければ unknown_step）
+    - flag:     進捗フラグの set/clear
+    適用済みのキーは duplicate として何もしない。
+    同じユーザーの別リクエストと同時に書き込みが衝突した場合は 409 を返すので、同じキーのまま再送する。
+    """
+    principal = await current_user_from_cookie(request, db)
+    now = datetime.now(timezone.utc)
+    if any(e.type == "flag" for e in payload.events):
+        # 溜まっているフラグを後から OR されるとここで落としたフラグが戻るので、先に反映しておく
+        await write_behind.flush_user(principal.id)
+
+    keys = list(dict.fromkeys(e.key for e in payload.events))
+    seen = set(await db.scalars(
+        select(ClientEvent.key).where(ClientEvent.user_id == principal.id, ClientEvent.key.in_(keys))
+    ))
+
+    results: list[dict] = []
+    completes: dict[int, list[dict]] = {}  # step_id -> そのステップの結果（出現順）
+    flags: dict[int, bool] = {}            # index -> 最終的な値
+    reward_of: dict[int, int] = {}
+    fresh_keys: list[str] = []
+    for ev in payload.events:
+        result = {"key": ev.key, "status": "duplicate"}
+        results.append(result)
+        if ev.key in seen:
+            continue
+        seen.add(ev.key)
+        fresh_keys.append(ev.key)
+        if ev.type == "flag":
+            flags[ev.index] = ev.value
+            result["status"] = "applied"
+            continue
+        step = await catalog.get_step(ev.step_id, db)
+        if step is None:
+            result["status"] = "unknown_step"
+            continue
+        reward_of[step.id] = step.xp_reward
+        completes.setdefault(step.id, []).append(result)
+
+    # キーを先に確定させる。同じキーを別リクエストが処理中ならここで衝突する
+    inserted = await insert_ignore(
+        db, ClientEvent,
+        [{"user_id": principal.id, "key": k} for k in fresh_keys],
+        conflict=["user_id", "key"],
     )
-    if prog and prog.is_cleared:
-        return {"message": "Already cleared", "level": user.level, "exp": user.exp}
+    if inserted != len(fresh_keys):
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Conflicting batch in progress")
+
+    reward = 0
+    if completes:
+        cleared = set(await db.scalars(
+            select(UserStepProgress.step_id)
+              .where(UserStepProgress.user_id == principal.id, UserStepProgress.step_id.in_(completes))
+        ))
+        new_steps = [sid for sid in completes if sid not in cleared]
+        inserted = await insert_ignore(
+            db, UserStepProgress,
+            [{"user_id": principal.id, "step_id": sid, "is_cleared": True, "cleared_at": now} for sid in new_steps],
+            conflict=["user_id", "step_id"],
+        )
+        if inserted != len(new_steps):
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Conflicting completion in progress")
+        for sid, step_results in completes.items():
+            is_new = sid not in cleared
+            for i, result in enumerate(step_results):
+                result["status"] = "applied" if is_new and i == 0 else "already_cleared"
+            if is_new:
+                reward += reward_of[sid]
 
-    if not prog:
-        prog = UserStepProgress(user_id=user.id, step_id=step.id)
+    if reward:
+        if await increment_exp(db, principal.id, reward) is None:
+            raise HTTPException(status_code=401, detail="User not found")
 
-    prog.is_cleared = True
-    prog.cleared_at = datetime.now(timezone.utc)
+    state_cols = [User.exp, User.level, User.progress_bits, User.progress_len]
+    if flags:
+        set_mask = mask_of(i for i, v in flags.items() if v)
+        keep_mask = full_mask() & ~mask_of(i for i, v in flags.items() if not v)
+        row = await update_returning(
+            db, User,
+            key=[User.id == principal.id],
+            when=[User.progress_len > max(flags)],
+            values={"progress_bits": User.progress_bits.op("|")(set_mask).op("&")(keep_mask)},
+            returning=state_cols,
+        )
+        if row is None:
+            # 更新できなかった理由（ユーザー無し / 範囲外）はエラー時だけ調べる
+            exists = await db.scalar(select(User.id).where(User.id == principal.id))
+            await db.rollback()
+            if exists is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            raise HTTPException(status_code=400, detail="Index out of range")
+        await progress_flags.apply_mask(db, principal.id, set_mask, keep_mask)
+    else:
+        row = (await db.execute(select(*state_cols).where(User.id == principal.id))).first()
+        if row is None:
+            raise HTTPException(status_code=401, detail="User not found")
+    await db.commit()
 
-    user.exp += step.xp_reward
-    _level_up(user)
+    exp = row.exp + write_behind.pending_exp(principal.id)
+    progress = to_bitstring(row.progress_bits | write_behind.pending_bits(principal.id), row.progress_len)
+    if reward or flags:
+        events.user_changed(principal.id, exp=exp, level=row.level, progress=progress)
+    return {"results": results, "level": row.level, "exp": exp, "progress": progress, "reward": reward}
 
-    db.add(prog)
-    db.add(user)
-    db.commit()
 
-    return {"message": "Cleared", "level": user.level, "exp": user.exp, "reward": step.xp_reward}
+async def _build_summary(principal, db: AsyncSession) -> dict:
+    """お題ごとのクリア数・総数・最初/最後のクリア日時を 1 回の集計クエリで求める"""
+    cleared = and_(
+        UserStepProgress.step_id == Step.id,
+        UserStepProgress.user_id == principal.id,
+        UserStepProgress.is_cleared.is_(True),
+    )
+    result = await db.execute(
+        select(
+            Topic.id, Topic.title,
+            func.count(Step.id).label("total"),
+            func.count(UserStepProgress.id).label("cleared"),
+            func.sum(case((UserStepProgress.id.isnot(None), Step.xp_reward), else_=0)).label("earned"),
+            func.min(UserStepProgress.cleared_at).label("first_cleared_at"),
+            func.max(UserStepProgress.cleared_at).label("last_cleared_at"),
+        )
+          .select_from(Topic)
+          .outerjoin(Step, Step.topic_id == Topic.id)
+          .outerjoin(UserStepProgress, cleared)
+          .group_by(Topic.id, Topic.title)
+          .order_by(Topic.id)
+    )
+    topics = [
+        {
+            "topic_id": r.id,
+            "title": r.title,
+            "cleared_steps": r.cleared,
+            "total_steps": r.total,
+            "earned_exp": r.earned or 0,
+            "completed": r.total > 0 and r.cleared == r.total,
+            "first_cleared_at": r.first_cleared_at,
+            "last_cleared_at": r.last_cleared_at,
+        }
+        for r in result
+    ]
+    return {
+        "user": {
+            "id": principal.id,
+            "email": principal.email,
+            "level": principal.level,
+            "exp": principal.exp,
+            "next_level_exp": exp_for_level(principal.level + 1),
+            "cleared_steps": sum(t["cleared_steps"] for t in topics),
+            "total_steps": sum(t["total_steps"] for t in topics),
+        },
+        "topics": topics,
+    }
+
+@router.get("/summary", response_model=ProgressSummaryOut)
+async def get_summary(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    ユーザーの概要（level/exp）とお題ごとの進捗
+    ユーザー単位でシリアライズ済みの本文をキャッシュし、進捗が変わったら破棄する。If-None-Match が一致すれば 304
+    """
+    principal = await current_user_from_cookie(request, db)
+    cached = summary_cache.get(principal.id)
+    if cached is None:
+        body = orjson.dumps(await _build_summary(principal, db))
+        cached = (f'"{hashlib.sha1(body).hexdigest()[:16]}"', body)
+        summary_cache.set(principal.id, cached)
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    # 自前で組み立てた値なので response_model の検証は通さずにそのまま返す
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,14 +1,91 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.deps import get_db
+import base64
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.deps import get_read_db
+from app.db.base import AsyncSessionLocal
 from app.db.models import User
+from app.core.leaderboard import leaderboard
+from app.routers.auth import current_user_from_cookie
+from app.schemas.ranking import MyRankOut, RankingEntryOut, UserRankOut
 
 router = APIRouter(prefix="/ranking", tags=["ranking"])
 
-@router.get("")
-def get_ranking(db: Session = Depends(get_db), limit: int = 50):
-    rows = db.query(User.id, User.email, User.level, User.exp) \
-             .order_by(desc(User.level), desc(User.exp)) \
-             .limit(limit).all()
-    return [{"user_id": r.id, "email": r.email, "level": r.level, "exp": r.exp} for r in rows]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+async def _ensure_fresh() -> None:
+    # 起動直後や RANKING_REFRESH_SEC 経過時だけ DB から読み直す（同時に来ても読み直しは 1 回）。
+    # 遅れているレプリカから読むと直前の更新がメモリ上のランキングから消えるので primary から読む
+    await leaderboard.ensure_fresh(AsyncSessionLocal)
+
+def _encode_cursor(row: dict) -> str:
+    # 順位はクライアントから受け取らない（サーバー側の並びから付け直す）ので、位置のキーだけ入れる
+    raw = json.dumps([row["level"], row["exp"], row["user_id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[int, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        # 以前の形式（末尾に rank 付き）のカーソルも受け付け、rank は使わない
+        level, exp, user_id = json.loads(raw)[:3]
+        return int(level), int(exp), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _ranked_before(level: int, exp: int, user_id: int):
+    """(level DESC, exp DESC, id ASC) の並びで指定位置より前にある行の条件"""
+    return or_(
+        User.level > level,
+        and_(User.level == level, User.exp > exp),
+        and_(User.level == level, User.exp == exp, User.id < user_id),
+    )
+
+@router.get("", response_model=list[RankingEntryOut])
+async def get_ranking(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+):
+    """
+    ランキングを上位から返す。続きがある場合は X-Next-Cursor ヘッダーに
+    次ページ用のカーソルを入れるので、それを cursor に渡して続きを取得する
+    最大 500 件になるので、行は検証せずに ORJSONResponse でそのまま返す
+    """
+    # どのページもメモリ上のランキングから返す（ページ間で並びと順位の基準が食い違わないように）
+    await _ensure_fresh()
+    if cursor is None:
+        rows = leaderboard.top(limit + 1)
+    else:
+        # 2ページ目以降は前ページ末尾の (level, exp, id) の続きから。順位はサーバー側の位置で付ける
+        level, exp, user_id = _decode_cursor(cursor)
+        rows = leaderboard.after(level, exp, user_id, limit + 1)
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = _encode_cursor(rows[-1])
+    return ORJSONResponse(rows, headers=headers)
+
+@router.get("/me", response_model=MyRankOut)
+async def get_my_rank(request: Request, db: AsyncSession = Depends(get_read_db)):
+    """
+    ログインユーザーの順位を、自分より上位の件数をインデックス上で数えて求める
+    """
+    user = await current_user_from_cookie(request, db)
+    ahead = await db.scalar(
+        select(func.count(User.id)).where(_ranked_before(user.level, user.exp, user.id))
+    )
+    return {"user_id": user.id, "rank": ahead + 1, "level": user.level, "exp": user.exp}
+
+@router.get("/users/{user_id}", response_model=UserRankOut)
+async def get_user_rank(user_id: int, radius: int = Query(5, ge=0, le=50)):
+    """
+    指定ユーザーの順位と前後 radius 件の周辺ランキング
+    """
+    await _ensure_fresh()
+    found = leaderboard.around(user_id, radius)
+    if found is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    rank, neighbors = found
+    return ORJSONResponse({"user_id": user_id, "rank": rank, "total": leaderboard.total, "neighbors": neighbors})
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.deps import get_db
+from app.core.catalog import catalog
+from app.schemas.topics import TopicOut
+
+router = APIRouter(prefix="/topics", tags=["topics"])
+
+@router.get("", response_model=list[TopicOut])
+async def list_topics(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    お題とステップの一覧（ツリー）
+    内容が変わっていなければ If-None-Match に対して 304 を返す
+    """
+    await catalog.ensure_fresh(db)
+    etag = f'"{catalog.version}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    # 読み込み時にシリアライズ済みの本文を返す
+    return Response(catalog.tree_json, media_type="application/json", headers=headers)
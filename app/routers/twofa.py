@@ -1,53 +1,55 @@
 import secrets, hashlib
 import logging
-import sys
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.deps import get_db
-from app.schemas.auth import Request2FAIn, Verify2FAIn
+from app.schemas.auth import LatestCodeOut, MessageOut, Request2FAIn, Verify2FAIn
 from app.db.models import VerificationCode, User
-from app.core.emailer import send_verification_code
+from app.core.emailer import deliver_verification_code
 from app.core.config import settings
+from app.core.ratelimit import rate_limit
 
-# ロガーの設定
-logger = logging.getLogger("uvicorn.twofa")
-logger.setLevel(logging.DEBUG)
+# レベルは Settings の LOG_LEVEL / LOG_LEVELS で決める
+logger = logging.getLogger("app.twofa")
 
 router = APIRouter(prefix="/2fa", tags=["2fa"])
 
 def _hash_code(code: str) -> str:
     return hashlib.sha256(code.encode()).hexdigest()
 
-@router.post("/request")
-async def request_code(payload: Request2FAIn, db: Session = Depends(get_db)):
+# コードの再発行・メール送信より先に弾く
+_request_limit = rate_limit("2fa-request", settings.TWOFA_REQUEST_RATE_PER_IP, settings.TWOFA_REQUEST_RATE_PER_EMAIL)
+
+@router.post("/request", response_model=MessageOut, dependencies=[Depends(_request_limit)])
+async def request_code(payload: Request2FAIn, db: AsyncSession = Depends(get_db)):
     try:
-        logger.info(f"2FAリクエストを受信: email={payload.email}")
+        logger.debug("[2FA] 2FAリクエストを受信: email=%s", payload.email)
         
         try:
             # 既存のコードをクリア
-            deleted = db.query(VerificationCode).filter(
-                VerificationCode.email == payload.email
-            ).delete()
-            logger.debug(f"[2FA] 🗑 削除された既存のコード数: {deleted}")
-            db.commit()
+            result = await db.execute(
+                delete(VerificationCode).where(VerificationCode.email == payload.email)
+            )
+            logger.debug("[2FA] 🗑 削除された既存のコード数: %d", result.rowcount)
+            await db.commit()
 
             # 6桁コードを生成（000000〜999999）
             code = f"{secrets.randbelow(1_000_000):06d}"
             
-            # ログ出力（複数の方法で出力）
-            logger.info(f"[2FA] 🔑 認証コード生成: {payload.email}: {code}")
-            logger.debug(f"[2FA] 📝 コード詳細 - メール: {payload.email}, コード: {code}")
-            print(f"\n[2FA Console] 🔐 認証コード情報: {payload.email}: {code}\n", flush=True)
+            # コードそのものは DEBUG でのみ出す（MAIL_BACKEND=dummy かつ APP_ENV=dev なら emailer も出力する）
+            logger.debug("[2FA] 🔑 認証コード生成: %s: %s", payload.email, code)
 
             # メール送信処理
-            logger.info(f"[2FA] 📧 メール送信開始: {payload.email}")
-            send_verification_code(payload.email, code)
-            logger.info(f"[2FA] ✅ メール送信完了: {payload.email}")
-        except Exception as e:
-            error_msg = f"[2FA] ❌ 認証コード処理中にエラーが発生: {str(e)}"
-            logger.error(error_msg)
-            print(error_msg, file=sys.stderr, flush=True)
+            logger.debug("[2FA] 📧 メール送信開始: %s", payload.email)
+            # MAIL_BACKEND=queued なら送信キューに積んだ時点で戻る
+            await deliver_verification_code(payload.email, code)
+            logger.info("[2FA] ✅ メール送信完了: %s", payload.email)
+        except HTTPException:
+            raise
+        except Exception:
+            logger.exception("[2FA] ❌ 認証コード処理中にエラーが発生")
             raise HTTPException(status_code=500, detail="認証コードの処理に失敗しました。")
 
         # データベースに保存
@@ -59,69 +61,78 @@ async def request_code(payload: Request2FAIn, db: Session = Depends(get_db)):
             attempts_left=3
         )
         db.add(vc)
-        db.commit()
-        logger.info(f"[2FA] 認証コードをデータベースに保存: {payload.email}")
+        await db.commit()
+        logger.debug("[2FA] 認証コードをデータベースに保存: %s", payload.email)
 
         return {"message": "Verification code sent"}
         
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        logger.error(f"[2FA] エラーが発生: {str(e)}")
-        db.rollback()
+        logger.exception("[2FA] エラーが発生")
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"認証コードの処理中にエラーが発生しました: {str(e)}"
         )
 
-@router.post("/verify")
-def verify_code(payload: Verify2FAIn, db: Session = Depends(get_db)):
+@router.post("/verify", response_model=MessageOut)
+async def verify_code(payload: Verify2FAIn, db: AsyncSession = Depends(get_db)):
     # 最新のレコードを拾う
-    logger.debug(f"Verifying code for email: {payload.email}")
-    vc = (
-        db.query(VerificationCode)
-          .filter(VerificationCode.email == payload.email)
+    logger.debug("Verifying code for email: %s", payload.email)
+    result = await db.execute(
+        select(VerificationCode)
+          .where(VerificationCode.email == payload.email)
           .order_by(VerificationCode.created_at.desc())
-          .first()
+          .limit(1)
     )
+    vc = result.scalars().first()
     if not vc:
-        logger.warning(f"No verification code found for email: {payload.email}")
+        logger.warning("No verification code found for email: %s", payload.email)
         raise HTTPException(status_code=400, detail="No code requested")
+    # 使い切ったコードは期限切れ扱いにもしているので、試行回数を先に見る
+    if vc.attempts_left <= 0:
+        logger.warning("No attempts left for email: %s", payload.email)
+        raise HTTPException(status_code=400, detail="No attempts left")
     current_time = datetime.now(timezone.utc)
     expires_at = vc.expires_at if vc.expires_at.tzinfo else vc.expires_at.replace(tzinfo=timezone.utc)
     if expires_at < current_time:
-        logger.warning(f"Code expired for email: {payload.email}")
+        logger.info("Code expired for email: %s", payload.email)
         raise HTTPException(status_code=400, detail="Code expired")
-    if vc.attempts_left <= 0:
-        logger.warning(f"No attempts left for email: {payload.email}")
-        raise HTTPException(status_code=400, detail="No attempts left")
 
-    logger.debug(f"Checking code hash for email: {payload.email}")
+    logger.debug("Checking code hash for email: %s", payload.email)
     if _hash_code(payload.code) != vc.code_hash:
         vc.attempts_left -= 1
-        db.commit()
-        logger.warning(f"Invalid code for email: {payload.email}. Attempts left: {vc.attempts_left}")
+        if vc.attempts_left <= 0:
+            # 使い切ったら掃除の対象にする
+            vc.expires_at = current_time
+        await db.commit()
+        logger.warning("Invalid code for email: %s. Attempts left: %d", payload.email, vc.attempts_left)
         raise HTTPException(status_code=400, detail="Invalid code")
 
-    logger.info(f"Successful 2FA verification for email: {payload.email}")
+    logger.info("Successful 2FA verification for email: %s", payload.email)
     return {"message": "2FA success"}
 
 # テスト用エンドポイントを追加
-@router.get("/debug/latest-code/{email}")
-async def get_latest_code(email: str, db: Session = Depends(get_db)):
+@router.get("/debug/latest-code/{email}", response_model=LatestCodeOut)
+async def get_latest_code(email: str, db: AsyncSession = Depends(get_db)):
     """
     開発環境でのテスト用：最新の認証コード情報を取得
     注意：本番環境では無効化すること
     """
     try:
-        logger.debug(f"Fetching latest verification code for email: {email}")
-        vc = (
-            db.query(VerificationCode)
-              .filter(VerificationCode.email == email)
+        logger.debug("Fetching latest verification code for email: %s", email)
+        result = await db.execute(
+            select(VerificationCode)
+              .where(VerificationCode.email == email)
               .order_by(VerificationCode.created_at.desc())
-              .first()
+              .limit(1)
         )
+        vc = result.scalars().first()
         
         if not vc:
-            logger.warning(f"No verification code found for email: {email}")
+            logger.warning("No verification code found for email: %s", email)
             raise HTTPException(status_code=404, detail="No verification code found")
         
         current_time = datetime.now(timezone.utc)
@@ -136,8 +147,10 @@ async def get_latest_code(email: str, db: Session = Depends(get_db)):
             "attempts_left": vc.attempts_left,
             "is_expired": expires_at < current_time
         }
-        logger.debug(f"Verification code details: {response_data}")
+        logger.debug("Verification code details: %s", response_data)
         return response_data
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching verification code: {str(e)}")
+        logger.exception("Error fetching verification code")
         raise HTTPException(status_code=500, detail=str(e))
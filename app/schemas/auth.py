@@ -21,3 +21,19 @@ class Verify2FAIn(BaseModel):
 
 class StepCompleteIn(BaseModel):
     step_id: int
+
+class MeOut(BaseModel):
+    id: int
+    email: str
+    level: int
+    exp: int
+
+class MessageOut(BaseModel):
+    message: str
+
+class LatestCodeOut(BaseModel):
+    email: str
+    created_at: str  # ISO 8601
+    expires_at: str
+    attempts_left: int
+    is_expired: bool
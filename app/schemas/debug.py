@@ -0,0 +1,38 @@
+from typing import Optional
+from pydantic import BaseModel
+
+# --- /debug/sql-profiles ---
+
+class SQLProfileSummaryOut(BaseModel):
+    id: int
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    queries: int
+    db_ms: float
+    n_plus_1: int  # N+1 候補の件数
+    profiled: bool
+
+class NPlusOneOut(BaseModel):
+    sql: str
+    count: int
+    total_ms: float
+    sites: list[str]
+
+class SQLStatementOut(BaseModel):
+    sql: str
+    ms: float
+    site: str
+
+class SQLProfileOut(BaseModel):
+    id: int
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    queries: int
+    db_ms: float
+    n_plus_1: list[NPlusOneOut]
+    statements: list[SQLStatementOut]
+    profile: Optional[str] = None  # cProfile の上位（サンプルされたときだけ）
@@ -0,0 +1,87 @@
+from datetime import datetime
+from typing import Annotated, Literal, Union
+from pydantic import BaseModel, Field
+from app.core.bitset import MAX_BITS
+from app.core.config import settings
+
+class ProgressBitsIn(BaseModel):
+    # 同じインデックスが両方にある場合は clear を優先する
+    set: list[int] = Field(default_factory=list, max_length=MAX_BITS)
+    clear: list[int] = Field(default_factory=list, max_length=MAX_BITS)
+
+# --- /progress/batch ---
+# key はクライアントが振る冪等キー。同じキーの再送は二重に適用されない
+
+class CompleteEventIn(BaseModel):
+    type: Literal["complete"]
+    key: str = Field(min_length=1, max_length=64)
+    step_id: int
+
+class FlagEventIn(BaseModel):
+    type: Literal["flag"]
+    key: str = Field(min_length=1, max_length=64)
+    index: int = Field(ge=0, lt=MAX_BITS)
+    value: bool = True
+
+BatchEventIn = Annotated[Union[CompleteEventIn, FlagEventIn], Field(discriminator="type")]
+
+class ProgressBatchIn(BaseModel):
+    # 先頭から順に適用する（同じフラグへの変更は後のものが勝つ）
+    events: list[BatchEventIn] = Field(min_length=1, max_length=settings.PROGRESS_BATCH_MAX)
+
+# --- レスポンス ---
+
+class CompleteOut(BaseModel):
+    message: str
+    level: int
+    exp: int
+    reward: int | None = None
+
+class BatchResultOut(BaseModel):
+    key: str
+    status: Literal["applied", "duplicate", "already_cleared", "unknown_step"]
+
+class ProgressBatchOut(BaseModel):
+    results: list[BatchResultOut]
+    level: int
+    exp: int
+    progress: str
+    reward: int
+
+class SummaryUserOut(BaseModel):
+    id: int
+    email: str
+    level: int
+    exp: int
+    next_level_exp: int
+    cleared_steps: int
+    total_steps: int
+
+class SummaryTopicOut(BaseModel):
+    topic_id: int
+    title: str
+    cleared_steps: int
+    total_steps: int
+    earned_exp: int
+    completed: bool
+    first_cleared_at: datetime | None
+    last_cleared_at: datetime | None
+
+class ProgressSummaryOut(BaseModel):
+    user: SummaryUserOut
+    topics: list[SummaryTopicOut]
+
+# --- /users/{user_id}/exp, /users/{user_id}/progress ---
+
+class ExpOut(BaseModel):
+    user_id: int
+    exp: int
+
+class ProgressOut(BaseModel):
+    user_id: int
+    progress: str
+
+class CompletedUsersOut(BaseModel):
+    index: int
+    user_ids: list[int]
+    next_after_id: int | None
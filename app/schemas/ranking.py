@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+
+class RankingEntryOut(BaseModel):
+    rank: int
+    user_id: int
+    email: str
+    level: int
+    exp: int
+
+class MyRankOut(BaseModel):
+    user_id: int
+    rank: int
+    level: int
+    exp: int
+
+class UserRankOut(BaseModel):
+    user_id: int
+    rank: int
+    total: int
+    neighbors: list[RankingEntryOut]
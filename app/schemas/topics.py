@@ -0,0 +1,14 @@
+from typing import Optional
+from pydantic import BaseModel
+
+class StepOut(BaseModel):
+    id: int
+    order_no: int
+    title: str
+    xp_reward: int
+
+class TopicOut(BaseModel):
+    id: int
+    title: str
+    description: Optional[str]
+    steps: list[StepOut]
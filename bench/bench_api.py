@@ -0,0 +1,177 @@
+"""
+主要 API の負荷ベンチマーク
+
+    python -m bench.bench_api --users 1000 --requests 2000 --concurrency 50
+    python -m bench.bench_api --save-baseline bench/baseline.json
+    python -m bench.bench_api --baseline bench/baseline.json   # 劣化していれば終了コード 1
+
+seed.py のお題・ステップと N 人分のユーザー（ランダムな進捗付き）を投入し、
+/auth/login, /auth/me, /progress/complete, /ranking, /2fa/request をシナリオごとに叩いて
+スループット・p50/p95/p99・1 リクエストあたりのクエリ数を JSON で出す。
+既定では一時 SQLite を使う。--database-url で手元の MySQL/MariaDB 等にも向けられる（スキーマは作り直す）。
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+
+from bench.common import QueryCounter, auth_cookies, configure, drive, reset_schema, running_app
+
+SCENARIOS = ("login", "me", "complete", "ranking", "2fa_request")
+PASSWORD = "bench-password"
+
+
+def _seed(user_count: int, seed: int) -> tuple[list[str], list[int], list[tuple[int, int]]]:
+    """
+    ユーザーと進捗を投入し、(メールアドレス一覧, user_id 一覧, 未クリアの (user_id, step_id) 一覧) を返す
+    """
+    from sqlalchemy import insert, select
+    from app.core.leveling import level_for_exp
+    from app.core.security import hash_password
+    from app.db.base import SessionLocal
+    from app.db.models import Step, User, UserStepProgress
+    from app.db.seed import seed as seed_topics
+
+    # seed.py の進捗表示が結果の JSON に混ざらないよう stderr に流す
+    with contextlib.redirect_stdout(sys.stderr):
+        seed_topics()
+    rng = random.Random(seed)
+    password_hash = hash_password(PASSWORD)
+    db = SessionLocal()
+    try:
+        steps = db.execute(select(Step.id, Step.xp_reward)).all()
+        emails = [f"bench{i}@example.com" for i in range(user_count)]
+        cleared_by_user = [[s for s in steps if rng.random() < 0.5] for _ in emails]
+        db.execute(insert(User), [
+            {
+                "email": email,
+                "password_hash": password_hash,
+                "exp": sum(s.xp_reward for s in cleared),
+                "level": level_for_exp(sum(s.xp_reward for s in cleared)),
+                "progress_bits": rng.getrandbits(4),
+                "progress_len": 4,
+            }
+            for email, cleared in zip(emails, cleared_by_user)
+        ])
+        ids = dict(db.execute(select(User.email, User.id)).all())
+        progress_rows = [
+            {"user_id": ids[email], "step_id": s.id, "is_cleared": True}
+            for email, cleared in zip(emails, cleared_by_user)
+            for s in cleared
+        ]
+        if progress_rows:
+            db.execute(insert(UserStepProgress), progress_rows)
+        db.commit()
+        open_pairs = [
+            (ids[email], s.id)
+            for email, cleared in zip(emails, cleared_by_user)
+            for s in steps if s not in cleared
+        ]
+        rng.shuffle(open_pairs)
+        return emails, [ids[email] for email in emails], open_pairs
+    finally:
+        db.close()
+
+
+async def run(args) -> dict:
+    emails, user_ids, open_pairs = _seed(args.users, args.seed)
+    total, concurrency = args.requests, args.concurrency
+    counter = QueryCounter().attach()
+    results = {}
+    async with running_app() as client:
+        cookies = [auth_cookies(uid) for uid in user_ids]
+        cookies_of = dict(zip(user_ids, cookies))
+        requests = {
+            "login": lambda i: client.post(
+                "/auth/login", json={"email": emails[i % len(emails)], "password": PASSWORD}
+            ),
+            "me": lambda i: client.get("/auth/me", cookies=cookies[i % len(cookies)]),
+            # 未クリアのものから順に完了させる（尽きたら「クリア済み」の応答になる）
+            "complete": lambda i: client.post(
+                "/progress/complete",
+                json={"step_id": open_pairs[i % len(open_pairs)][1]},
+                cookies=cookies_of[open_pairs[i % len(open_pairs)][0]],
+            ),
+            "ranking": lambda i: client.get("/ranking", params={"limit": 100}),
+            "2fa_request": lambda i: client.post("/2fa/request", json={"email": emails[i % len(emails)]}),
+        }
+        for name in args.scenarios:
+            if args.warmup:
+                await drive(requests[name], min(args.warmup, total), concurrency)
+            results[name] = await drive(requests[name], total, concurrency, counter)
+    return {
+        "config": {
+            "users": args.users,
+            "requests": total,
+            "concurrency": concurrency,
+            "database": os.environ["DATABASE_URL"].split("://")[0],
+        },
+        "scenarios": results,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    baseline より悪化した項目を返す
+    - rps が (1 - tolerance) 倍を下回る / p95 が (1 + tolerance) 倍を超える
+    - 1 リクエストあたりのクエリ数が増えた（環境に依らないので許容幅なし）
+    - エラーが出た
+    """
+    regressions = []
+    for name, current in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if current["errors"] > 0:
+            regressions.append(f"{name}: {current['errors']} errors")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {base['rps']} -> {current['rps']}")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current.get("queries_per_request", 0) > base.get("queries_per_request", 0) + 0.01:
+            regressions.append(
+                f"{name}: queries/request {base.get('queries_per_request')} -> {current['queries_per_request']}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000, help="シナリオごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=100, help="計測前に投げるリクエスト数")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite ファイルのパス（省略時は一時ディレクトリ）")
+    parser.add_argument("--database-url", help="SQLite 以外に向ける場合の URL（同期ドライバの形式）")
+    parser.add_argument("--baseline", help="比較する基準結果の JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="rps / p95 の許容劣化率")
+    parser.add_argument("--save-baseline", help="結果を基準として保存するパス")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    configure(args.db)
+    reset_schema()
+    result = asyncio.run(run(args))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        result["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    print(json.dumps(result, indent=2))
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+POST /progress/complete の 1 回あたりのレイテンシと発行クエリ数を測る
+
+    python -m bench.bench_complete_step --users 50 --steps 20 --concurrency 10
+
+初回クリアと「クリア済み」の 2 通りをそれぞれ計測する。
+"""
+import argparse
+import asyncio
+import json
+
+from bench.common import QueryCounter, auth_cookies, configure, drive, reset_schema, running_app
+
+
+def _setup(user_count: int, step_count: int) -> tuple[list[int], list[int]]:
+    from app.db.base import SessionLocal
+    from app.db.models import Step, Topic, User
+    db = SessionLocal()
+    try:
+        users = [User(email=f"bench{i}@example.com", password_hash="x") for i in range(user_count)]
+        topic = Topic(title="bench", description="bench")
+        db.add_all([*users, topic])
+        db.flush()
+        steps = [Step(topic_id=topic.id, order_no=i + 1, title=f"step {i + 1}", xp_reward=10)
+                 for i in range(step_count)]
+        db.add_all(steps)
+        db.commit()
+        return [u.id for u in users], [s.id for s in steps]
+    finally:
+        db.close()
+
+
+async def _measure(client, user_ids, step_ids, concurrency, counter) -> dict:
+    pairs = [(u, s) for u in user_ids for s in step_ids]
+    return await drive(
+        lambda i: client.post(
+            "/progress/complete", json={"step_id": pairs[i][1]}, cookies=auth_cookies(pairs[i][0])
+        ),
+        len(pairs), concurrency, counter,
+    )
+
+
+async def run(user_count: int, step_count: int, concurrency: int) -> dict:
+    user_ids, step_ids = _setup(user_count, step_count)
+    counter = QueryCounter().attach()
+    async with running_app() as client:
+        # 認証キャッシュを温めてから測る
+        for user_id in user_ids:
+            await client.get("/auth/me", cookies=auth_cookies(user_id))
+        first = await _measure(client, user_ids, step_ids, concurrency, counter)
+        again = await _measure(client, user_ids, step_ids, concurrency, counter)
+    return {"first_clear": first, "already_cleared": again}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--db", help="SQLite ファイルのパス（省略時は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    configure(args.db)
+    reset_schema()
+    print(json.dumps(asyncio.run(run(args.users, args.steps, args.concurrency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
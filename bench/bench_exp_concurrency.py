@@ -0,0 +1,118 @@
+"""
+同一ユーザーへの exp 加算・ステップ完了を同時に大量に投げ、
+取りこぼし（lost update）が無いことと処理性能を確認する
+
+    python -m bench.bench_exp_concurrency --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from bench.common import auth_cookies, configure, reset_schema, running_app
+
+
+def _setup(step_count: int) -> tuple[int, list[int]]:
+    from app.db.base import SessionLocal
+    from app.db.models import Step, Topic, User
+    db = SessionLocal()
+    try:
+        user = User(email="bench@example.com", password_hash="x")
+        topic = Topic(title="bench", description="bench")
+        db.add_all([user, topic])
+        db.flush()
+        steps = [Step(topic_id=topic.id, order_no=i + 1, title=f"step {i + 1}", xp_reward=1)
+                 for i in range(step_count)]
+        db.add_all(steps)
+        db.commit()
+        return user.id, [s.id for s in steps]
+    finally:
+        db.close()
+
+
+def _user_state(user_id: int) -> tuple[int, int]:
+    from app.db.base import SessionLocal
+    from app.db.models import User
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        return user.exp, user.level
+    finally:
+        db.close()
+
+
+async def _hammer(make_request, total: int, concurrency: int) -> tuple[float, int]:
+    sem = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            response = await make_request(i)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, errors
+
+
+async def run(total: int, concurrency: int) -> list[dict]:
+    from app.core.leveling import level_for_exp
+    from app.core.writebehind import write_behind
+
+    user_id, step_ids = _setup(total)
+    results = []
+    async with running_app() as client:
+        client.cookies.update(auth_cookies(user_id))
+
+        elapsed, errors = await _hammer(
+            lambda i: client.post("/progress/complete", json={"step_id": step_ids[i]}),
+            total, concurrency,
+        )
+        exp, level = _user_state(user_id)
+        results.append({
+            "scenario": "complete_step",
+            "requests": total, "concurrency": concurrency, "errors": errors,
+            "elapsed_sec": round(elapsed, 3), "rps": round(total / elapsed, 1),
+            "expected_exp": total, "actual_exp": exp,
+            "expected_level": level_for_exp(total), "actual_level": level,
+            "ok": errors == 0 and exp == total and level == level_for_exp(total),
+        })
+
+        elapsed, errors = await _hammer(
+            lambda i: client.put(f"/users/{user_id}/exp", params={"amount": 1}),
+            total, concurrency,
+        )
+        # WRITE_BEHIND_ENABLED のときは溜まっている分を反映してから DB を読む（反映にかかった時間も含める）
+        start = time.perf_counter()
+        await write_behind.flush()
+        elapsed += time.perf_counter() - start
+        exp_after, _ = _user_state(user_id)
+        results.append({
+            "scenario": "update_exp",
+            "requests": total, "concurrency": concurrency, "errors": errors,
+            "elapsed_sec": round(elapsed, 3), "rps": round(total / elapsed, 1),
+            "expected_exp": exp + total, "actual_exp": exp_after,
+            "ok": errors == 0 and exp_after == exp + total,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db", help="SQLite ファイルのパス（省略時は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    configure(args.db)
+    reset_schema()
+    results = asyncio.run(run(args.requests, args.concurrency))
+    print(json.dumps(results, indent=2))
+    if not all(r["ok"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
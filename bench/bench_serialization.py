@@ -0,0 +1,109 @@
+"""
+/ranking?limit=500 の応答 1 件あたりのシリアライズ・圧縮コスト
+
+    python -m bench.bench_serialization --users 2000 --iterations 500
+
+同じ 500 行に対して
+- before:    response_model なしの FastAPI の既定経路（jsonable_encoder + 標準 json の JSONResponse）
+- validated: response_model で検証してから orjson で書き出した場合
+- after:     行をそのまま ORJSONResponse で書き出す（get_ranking の現在の経路）
+の 1 回あたりの時間を測り、本文を gzip / br（brotli がある場合）で圧縮したときの時間とサイズも出す。
+あわせて、アプリ経由で /ranking?limit=500 を圧縮なし・ありで叩いたスループットとレイテンシも載せる
+（in-process でネットワークを通らないので、圧縮ありの側には圧縮・展開の CPU コストだけが乗る）。
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+
+from bench.common import configure, drive, reset_schema, running_app
+
+
+def _per_call_us(fn, iterations: int) -> float:
+    fn()  # 初回のキャッシュ作成等を除く
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return round((time.perf_counter() - start) / iterations * 1_000_000, 1)
+
+
+def measure_serialization(rows: list[dict], iterations: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from pydantic import TypeAdapter
+    from app.core import compression
+    from app.core.config import settings
+    from app.schemas.ranking import RankingEntryOut
+
+    adapter = TypeAdapter(list[RankingEntryOut])
+    body = ORJSONResponse(rows).body
+    result = {
+        "rows": len(rows),
+        "bytes": len(body),
+        "serialize_us": {
+            "before": _per_call_us(lambda: JSONResponse(jsonable_encoder(rows)), iterations),
+            "validated": _per_call_us(
+                lambda: ORJSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json")), iterations
+            ),
+            "after": _per_call_us(lambda: ORJSONResponse(rows), iterations),
+        },
+        "compression": {},
+    }
+    encodings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    for encoding in encodings:
+        compressed = compression.compress(
+            body, encoding, settings.COMPRESSION_GZIP_LEVEL, settings.COMPRESSION_BROTLI_QUALITY
+        )
+        result["compression"][encoding] = {
+            "bytes": len(compressed),
+            "us": _per_call_us(
+                lambda: compression.compress(
+                    body, encoding, settings.COMPRESSION_GZIP_LEVEL, settings.COMPRESSION_BROTLI_QUALITY
+                ),
+                iterations,
+            ),
+        }
+    return result
+
+
+async def run(args) -> dict:
+    from bench.bench_api import _seed
+    from app.core.leaderboard import leaderboard
+
+    with contextlib.redirect_stdout(sys.stderr):
+        _seed(args.users, args.seed)
+    results = {}
+    async with running_app() as client:
+        rows = leaderboard.top(500)
+        results["serialization"] = measure_serialization(rows, args.iterations)
+        for name, encoding in (("identity", "identity"), ("gzip", "gzip")):
+            headers = {"Accept-Encoding": encoding}
+            make = lambda i: client.get("/ranking", params={"limit": 500}, headers=headers)  # noqa: E731
+            await drive(make, min(args.warmup, args.requests), args.concurrency)
+            results[f"http_{name}"] = await drive(make, args.requests, args.concurrency)
+    return {
+        "config": {"users": args.users, "iterations": args.iterations, "requests": args.requests},
+        **results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=500, help="シリアライズ・圧縮の計測回数")
+    parser.add_argument("--requests", type=int, default=500, help="HTTP 経由で叩く回数")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite ファイルのパス（省略時は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    configure(args.db)
+    reset_schema()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
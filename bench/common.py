@@ -0,0 +1,128 @@
+"""
+ベンチマーク共通処理
+
+アプリをローカルの SQLite ファイルに向けて（MySQL 無しで）in-process 起動し、
+httpx の ASGITransport 経由でリクエストを投げる。
+app.* を import する前に configure() を呼ぶこと（Settings は import 時に読まれる）。
+"""
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+BENCH_DEFAULTS = {
+    "JWT_SECRET": "bench-secret",
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "MAIL_SENDER": "bench@example.com",
+    "MAIL_BACKEND": "dummy",
+    # ベンチでは bcrypt のコストを下げ、プロセスプールも使わない
+    "BCRYPT_ROUNDS": "4",
+    "HASH_WORKERS": "0",
+    # 同じ IP から大量に叩くのでレート制限は外し、ログも警告以上だけにする
+    "RATE_LIMIT_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+    "SQL_PROFILER": "false",
+}
+
+
+def configure(db_path: str | None = None) -> str:
+    """ベンチ用の環境変数を設定し、SQLite ファイルのパスを返す"""
+    for key, value in BENCH_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="gitsim-bench-"), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    return db_path
+
+
+def reset_schema() -> None:
+    from app.db.base import Base, engine
+    from app.db import models  # noqa: F401 (import for side-effects)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@asynccontextmanager
+async def running_app():
+    """lifespan を通したアプリと、それに繋がる AsyncClient"""
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+def auth_cookies(user_id: int) -> dict:
+    from app.core.security import create_access_token
+    from app.routers.auth import COOKIE_NAME
+    return {COOKIE_NAME: create_access_token(str(user_id))}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class QueryCounter:
+    """API 側（非同期エンジン）で実行された文の数を数える"""
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args, **kwargs) -> None:
+        self.count += 1
+
+    def attach(self) -> "QueryCounter":
+        from sqlalchemy import event
+        from app.db.base import async_engine
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+
+async def drive(
+    make_request: Callable[[int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int,
+    counter: Optional[QueryCounter] = None,
+    ok_status: tuple[int, ...] = (200,),
+) -> dict:
+    """make_request(i) を最大 concurrency 並列で total 回呼び、スループット・レイテンシ・クエリ数をまとめる"""
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    error_statuses: dict[int, int] = {}
+
+    async def one(i: int) -> None:
+        async with sem:
+            start = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in ok_status:
+                error_statuses[response.status_code] = error_statuses.get(response.status_code, 0) + 1
+
+    queries_before = counter.count if counter else 0
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    stats = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": sum(error_statuses.values()),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if error_statuses:
+        stats["error_statuses"] = {str(k): v for k, v in sorted(error_statuses.items())}
+    if counter is not None:
+        stats["queries_per_request"] = round((counter.count - queries_before) / total, 2)
+    return stats
@@ -0,0 +1,116 @@
+"""
+テスト共通の準備
+
+アプリは一時ディレクトリの SQLite ファイル（API 側は aiosqlite）に向けて動かす（MySQL 不要）。
+Settings は app.* の import 時に読まれるので、環境変数はこのファイルの先頭で設定する。
+テストごとにテーブルを作り直し、プロセス内のキャッシュ（ランキング・カタログ・認証・レート制限等）も空にする。
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="gitsim-tests-")
+
+TEST_ENV = {
+    "JWT_SECRET": "test-secret",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "test",
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TMP_DIR, 'primary.db')}",
+    "MAIL_SENDER": "test@example.com",
+    "MAIL_BACKEND": "dummy",
+    "BCRYPT_ROUNDS": "4",
+    "HASH_WORKERS": "0",
+    "STARTUP_HASH_WARMUP": "false",
+    "VERIFICATION_SWEEP_SEC": "0",
+    "LOG_QUEUE": "false",
+    "LOG_LEVEL": "WARNING",
+    "SQL_PROFILER": "false",
+    "DB_REPLICA_URLS": "[]",
+    # テストの途中で追加したステップをすぐ引けるように、見つからなければ毎回カタログを読み直す
+    "CATALOG_MISS_RELOAD_SEC": "0",
+}
+for _key, _value in TEST_ENV.items():
+    os.environ[_key] = _value
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.core import events, ratelimit  # noqa: E402
+from app.core.authcache import principal_cache, token_cache  # noqa: E402
+from app.core.catalog import catalog  # noqa: E402
+from app.core.leaderboard import leaderboard  # noqa: E402
+from app.core.security import COOKIE_NAME, create_access_token, hash_password  # noqa: E402
+from app.core.writebehind import write_behind  # noqa: E402
+from app.db import models  # noqa: E402,F401 (import for side-effects)
+from app.db.base import Base, SessionLocal, async_engine, engine  # noqa: E402
+from app.routers.progress import summary_cache  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def tmp_db_url(name: str) -> str:
+    """primary とは別の SQLite ファイルの URL（レプリカの代わり等）"""
+    return f"sqlite:///{os.path.join(_TMP_DIR, name)}"
+
+
+def _reset_state() -> None:
+    leaderboard.load([])
+    leaderboard._loaded_at = None
+    catalog._loaded_at = None
+    principal_cache.clear()
+    token_cache.clear()
+    summary_cache.clear()
+    ratelimit.backend.clear()
+    write_behind._pending.clear()
+    write_behind._inflight.clear()
+
+
+@pytest.fixture(autouse=True)
+async def fresh_db(anyio_backend):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    _reset_state()
+    yield
+    # テストごとにイベントループが変わるので、非同期エンジンの接続は持ち越さない
+    await async_engine.dispose()
+    _reset_state()
+
+
+@pytest.fixture
+async def client():
+    """lifespan を通したアプリに繋がる AsyncClient"""
+    from app.main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            yield c
+
+
+def add_user(email: str, *, password: str = "password123", level: int = 1, exp: int = 0,
+             progress_len: int = 8) -> int:
+    with SessionLocal() as db:
+        user = models.User(
+            email=email, password_hash=hash_password(password),
+            level=level, exp=exp, progress_len=progress_len,
+        )
+        db.add(user)
+        db.commit()
+        # API の登録と同じく、メモリ上の状態（ランキング等）にも知らせる
+        events.user_row_changed(user)
+        return user.id
+
+
+def add_step(xp_reward: int = 10, title: str = "topic") -> int:
+    with SessionLocal() as db:
+        topic = models.Topic(title=title)
+        step = models.Step(topic=topic, order_no=1, title="step", xp_reward=xp_reward)
+        db.add(step)
+        db.commit()
+        return step.id
+
+
+def cookies_for(user_id: int) -> dict:
+    return {COOKIE_NAME: create_access_token(str(user_id))}
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.core.leveling import exp_for_level, level_for_exp
+from app.db.atomic import increment_exp
+from app.db.base import AsyncSessionLocal, SessionLocal
+from app.db.models import User
+from tests.conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("level", range(1, 30))
+def test_level_for_exp_matches_thresholds(level):
+    threshold = exp_for_level(level)
+    assert level_for_exp(threshold) == level
+    if threshold > 0:
+        assert level_for_exp(threshold - 1) == level - 1
+
+
+async def _increment(user_id: int, amount: int, **kwargs):
+    async with AsyncSessionLocal() as db:
+        result = await increment_exp(db, user_id, amount, **kwargs)
+        await db.commit()
+        return result
+
+
+async def test_increment_returns_new_exp_and_levels_up():
+    user_id = add_user("a@example.com", exp=40)
+    assert await _increment(user_id, 15) == (55, 2)
+    assert await _increment(user_id, 200) == (255, 3)
+
+
+async def test_increment_never_lowers_the_level():
+    user_id = add_user("a@example.com", level=3, exp=250)
+    assert await _increment(user_id, -200) == (50, 3)
+
+
+async def test_increment_without_apply_level_keeps_the_level():
+    user_id = add_user("a@example.com")
+    assert await _increment(user_id, 500, apply_level=False) == (500, 1)
+
+
+async def test_increment_for_missing_user_is_none():
+    assert await _increment(12345, 10) is None
+
+
+async def test_concurrent_increments_are_not_lost():
+    user_id = add_user("a@example.com")
+    await asyncio.gather(*(_increment(user_id, 3) for _ in range(40)))
+    with SessionLocal() as db:
+        row = db.execute(select(User.exp, User.level).where(User.id == user_id)).one()
+    assert (row.exp, row.level) == (120, level_for_exp(120))
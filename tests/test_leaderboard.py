@@ -0,0 +1,84 @@
+import pytest
+
+from app.core.leaderboard import Leaderboard
+
+pytestmark = pytest.mark.anyio
+
+
+class _Row:
+    def __init__(self, id, email, level, exp):
+        self.id, self.email, self.level, self.exp = id, email, level, exp
+
+
+class _SlowDB:
+    """SELECT の実行中に on_execute を呼んでから rows を返すセッションの代わり"""
+
+    def __init__(self, rows, on_execute):
+        self.rows = rows
+        self.on_execute = on_execute
+
+    async def execute(self, stmt):
+        self.on_execute()
+        return [_Row(*r) for r in self.rows]
+
+
+def _ids(rows):
+    return [r["user_id"] for r in rows]
+
+
+def test_orders_by_level_exp_then_id():
+    lb = Leaderboard(refresh_sec=0)
+    lb.load([(1, "a", 2, 100), (2, "b", 3, 0), (3, "c", 2, 100), (4, "d", 2, 150)])
+    assert _ids(lb.top(10)) == [2, 4, 1, 3]
+    assert [r["rank"] for r in lb.top(10)] == [1, 2, 3, 4]
+    assert lb.rank_of(3) == 4
+    assert lb.rank_of(99) is None
+
+
+def test_update_moves_entry_and_after_continues_keyset():
+    lb = Leaderboard(refresh_sec=0)
+    lb.load([(i, f"u{i}", 1, i * 10) for i in range(1, 6)])
+    lb.update(1, None, 5, 0)
+    assert _ids(lb.top(2)) == [1, 5]
+    page = lb.after(1, 50, 5, 2)
+    assert _ids(page) == [4, 3]
+    assert [r["rank"] for r in page] == [3, 4]
+
+
+def test_update_for_unknown_user_without_email_is_ignored():
+    lb = Leaderboard(refresh_sec=0)
+    lb.load([])
+    lb.update(7, None, 2, 10)
+    assert lb.total == 0
+
+
+async def test_reload_replays_updates_made_during_the_select():
+    lb = Leaderboard(refresh_sec=0)
+    lb.load([(1, "a", 1, 125), (2, "b", 1, 50)])
+
+    def concurrent_writes():
+        lb.update(1, None, 3, 7777)
+        lb.discard(2)
+        lb.update(3, "c", 1, 10)
+
+    # SELECT の時点のスナップショット（更新前の値）
+    db = _SlowDB([(1, "a", 1, 125), (2, "b", 1, 50)], concurrent_writes)
+    await lb.load_from_db(db)
+
+    assert lb.top(10) == [
+        {"rank": 1, "user_id": 1, "email": "a", "level": 3, "exp": 7777},
+        {"rank": 2, "user_id": 3, "email": "c", "level": 1, "exp": 10},
+    ]
+    assert lb._journals == []
+
+
+async def test_failed_reload_closes_its_journal():
+    lb = Leaderboard(refresh_sec=0)
+
+    class _Broken:
+        async def execute(self, stmt):
+            raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        await lb.load_from_db(_Broken())
+    assert lb._journals == []
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.db.base import SessionLocal
+from app.db.models import ClientEvent, User, UserStepProgress
+from app.routers import progress
+from tests.conftest import add_step, add_user, cookies_for
+
+pytestmark = pytest.mark.anyio
+
+
+async def _batch(client, user_id, events):
+    return await client.post("/progress/batch", json={"events": events}, cookies=cookies_for(user_id))
+
+
+async def test_events_are_applied_once_per_key(client):
+    user_id = add_user("a@example.com")
+    step_id = add_step(xp_reward=30)
+    events = [
+        {"type": "complete", "key": "c1", "step_id": step_id},
+        {"type": "complete", "key": "c2", "step_id": step_id},
+        {"type": "flag", "key": "f1", "index": 2},
+        {"type": "complete", "key": "c3", "step_id": 9999},
+    ]
+
+    first = await _batch(client, user_id, events)
+    assert first.status_code == 200
+    body = first.json()
+    assert [r["status"] for r in body["results"]] == ["applied", "already_cleared", "applied", "unknown_step"]
+    assert body["reward"] == 30
+    assert body["exp"] == 30
+    assert body["progress"] == "00100000"
+
+    # 同じキーの再送は何も適用しない
+    again = await _batch(client, user_id, events)
+    assert again.status_code == 200
+    assert [r["status"] for r in again.json()["results"]] == ["duplicate"] * 4
+    assert again.json()["reward"] == 0
+    assert again.json()["exp"] == 30
+
+    with SessionLocal() as db:
+        assert db.scalar(select(User.exp).where(User.id == user_id)) == 30
+        assert db.scalar(select(func.count()).select_from(UserStepProgress)) == 1
+
+
+async def test_repeated_key_within_one_batch_is_a_duplicate(client):
+    user_id = add_user("a@example.com")
+    response = await _batch(client, user_id, [
+        {"type": "flag", "key": "k", "index": 1},
+        {"type": "flag", "key": "k", "index": 3},
+    ])
+    assert [r["status"] for r in response.json()["results"]] == ["applied", "duplicate"]
+    assert response.json()["progress"] == "01000000"
+
+
+async def test_concurrent_batch_with_the_same_key_is_a_409(client, monkeypatch):
+    user_id = add_user("a@example.com")
+    real_insert_ignore = progress.insert_ignore
+
+    async def racing_insert_ignore(db, entity, rows, conflict):
+        if entity is ClientEvent:
+            # 既存キーの確認と挿入の間に、別のリクエストが同じキーをコミットした状態を作る
+            with SessionLocal() as other:
+                other.add(ClientEvent(user_id=user_id, key="k1"))
+                other.commit()
+        return await real_insert_ignore(db, entity, rows, conflict)
+
+    monkeypatch.setattr(progress, "insert_ignore", racing_insert_ignore)
+    response = await _batch(client, user_id, [{"type": "flag", "key": "k1", "index": 0}])
+    assert response.status_code == 409
+
+    with SessionLocal() as db:
+        assert db.scalar(select(User.progress_bits).where(User.id == user_id)) == 0
+
+
+async def test_flag_out_of_range_rolls_back_the_keys(client):
+    user_id = add_user("a@example.com", progress_len=4)
+    response = await _batch(client, user_id, [{"type": "flag", "key": "k1", "index": 10}])
+    assert response.status_code == 400
+
+    retry = await _batch(client, user_id, [{"type": "flag", "key": "k1", "index": 1}])
+    assert retry.json()["results"] == [{"key": "k1", "status": "applied"}]
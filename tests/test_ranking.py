@@ -0,0 +1,61 @@
+import base64
+import json
+
+import pytest
+
+from app.routers.ranking import NEXT_CURSOR_HEADER
+from tests.conftest import add_user, cookies_for
+
+pytestmark = pytest.mark.anyio
+
+
+def _cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+async def test_pages_follow_the_cursor_with_server_side_ranks(client):
+    for i in range(5):
+        add_user(f"u{i}@example.com", exp=i * 10)
+
+    first = await client.get("/ranking", params={"limit": 2})
+    assert first.status_code == 200
+    assert [r["exp"] for r in first.json()] == [40, 30]
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+
+    second = await client.get("/ranking", params={"limit": 2, "cursor": cursor})
+    assert [(r["rank"], r["exp"]) for r in second.json()] == [(3, 20), (4, 10)]
+
+    last = await client.get("/ranking", params={"limit": 2, "cursor": second.headers[NEXT_CURSOR_HEADER]})
+    assert [(r["rank"], r["exp"]) for r in last.json()] == [(5, 0)]
+    assert NEXT_CURSOR_HEADER not in last.headers
+
+
+async def test_legacy_cursor_with_rank_ignores_the_client_rank(client):
+    for i in range(3):
+        add_user(f"u{i}@example.com", exp=i * 10)
+    top = (await client.get("/ranking", params={"limit": 1})).json()[0]
+
+    response = await client.get("/ranking", params={"cursor": _cursor([top["level"], top["exp"], top["user_id"], 999])})
+    assert [r["rank"] for r in response.json()] == [2, 3]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    _cursor([1, 2]),
+    _cursor({"level": 1}),
+    _cursor(["a", "b", "c"]),
+    _cursor(5),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+async def test_malformed_cursor_is_a_400(client, cursor):
+    response = await client.get("/ranking", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+async def test_my_rank(client):
+    low = add_user("low@example.com", exp=5)
+    add_user("high@example.com", exp=50)
+    response = await client.get("/ranking/me", cookies=cookies_for(low))
+    assert response.status_code == 200
+    assert response.json()["rank"] == 2
@@ -0,0 +1,73 @@
+import pytest
+
+from app.core import ratelimit
+from app.core.ratelimit import MemoryBackend, Rate
+from tests.conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("5/minute", Rate(5, 60.0)),
+    ("100/30s", Rate(100, 30.0)),
+    ("1/day", Rate(1, 86400.0)),
+])
+def test_parse(spec, expected):
+    assert Rate.parse(spec) == expected
+
+
+def test_parse_rejects_unknown_period():
+    with pytest.raises(ValueError):
+        Rate.parse("5/fortnight")
+
+
+async def test_bucket_allows_burst_then_reports_retry_after():
+    backend = MemoryBackend(max_keys=10)
+    rate = Rate(limit=3, period=60.0)
+    assert [await backend.hit("k", rate) for _ in range(3)] == [0.0, 0.0, 0.0]
+    retry_after = await backend.hit("k", rate)
+    assert 0 < retry_after <= 20.0
+    # キーごとに独立して数える
+    assert await backend.hit("other", rate) == 0.0
+
+
+async def test_bucket_evicts_least_recently_used_keys():
+    backend = MemoryBackend(max_keys=2)
+    rate = Rate(limit=1, period=60.0)
+    await backend.hit("a", rate)
+    await backend.hit("b", rate)
+    await backend.hit("c", rate)
+    # a は捨てられたので満タンからやり直しになる
+    assert await backend.hit("a", rate) == 0.0
+    assert await backend.hit("c", rate) > 0
+
+
+async def test_login_is_limited_per_email_before_password_check(client, monkeypatch):
+    add_user("a@example.com")
+    verified = []
+
+    async def counting_verify(plain, hashed):
+        verified.append(plain)
+        return False, None
+
+    monkeypatch.setattr("app.routers.auth.verify_and_update_password", counting_verify)
+    # 10/minute（LOGIN_RATE_PER_EMAIL の既定値）まではパスワードを検証する
+    payload = {"email": "a@example.com", "password": "wrong"}
+    statuses = [(await client.post("/auth/login", json=payload)).status_code for _ in range(10)]
+    assert statuses == [401] * 10
+
+    # 大文字小文字・前後の空白が違っても同じメールアドレスとして数える
+    limited = await client.post("/auth/login", json={"email": " A@example.com", "password": "wrong"})
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert len(verified) == 10
+
+    # 別のメールアドレスは IP 単位の枠が残っていれば通る
+    assert (await client.post("/auth/login", json={"email": "b@example.com", "password": "x"})).status_code == 401
+
+
+async def test_disabled_rate_limit_lets_everything_through(client, monkeypatch):
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_ENABLED", False)
+    payload = {"email": "nobody@example.com", "password": "wrong"}
+    statuses = {(await client.post("/auth/login", json=payload)).status_code for _ in range(15)}
+    assert statuses == {401}
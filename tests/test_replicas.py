@@ -0,0 +1,146 @@
+import asyncio
+import os
+import shutil
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.exc import OperationalError
+
+from app import deps
+from app.core import events
+from app.db import replicas
+from app.db.base import Base
+from app.db.models import User
+from app.db.replicas import ReplicaRouter
+from tests.conftest import _TMP_DIR, add_user, cookies_for, tmp_db_url
+
+pytestmark = pytest.mark.anyio
+
+
+def _make_replica_db(name: str, user_id: int, exp: int) -> str:
+    """user_id の exp だけ primary と違う値を入れたレプリカの代わりの SQLite ファイル"""
+    url = tmp_db_url(name)
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id=user_id, email=f"{name}@example.com", password_hash="x", exp=exp))
+    engine.dispose()
+    return url
+
+
+@pytest.fixture
+def user_id():
+    # primary では exp=0
+    return add_user("a@example.com")
+
+
+@pytest.fixture
+async def router(monkeypatch, user_id):
+    router = ReplicaRouter(
+        urls=[_make_replica_db("replica1.db", user_id, 1), _make_replica_db("replica2.db", user_id, 2)],
+        health_sec=60, max_lag_sec=2, sticky_sec=60,
+    )
+    # events.user_changed の購読と get_read_db はモジュールの replica_router を参照する
+    monkeypatch.setattr(replicas, "replica_router", router)
+    monkeypatch.setattr(deps, "replica_router", router)
+    yield router
+    await router.stop()
+
+
+async def _exp_via_session(router, *user_ids) -> int:
+    db, _ = router.session(*user_ids)
+    async with db:
+        return await db.scalar(text("SELECT exp FROM users ORDER BY id LIMIT 1"))
+
+
+async def test_reads_round_robin_over_healthy_replicas(router):
+    assert [await _exp_via_session(router) for _ in range(4)] == [1, 2, 1, 2]
+    assert [r.reads for r in router.replicas] == [2, 2]
+    assert router.primary_reads == 0
+
+
+async def test_user_changed_makes_that_user_read_from_primary(router, user_id):
+    events.user_changed(user_id, exp=5, level=1)
+    assert router.recently_wrote(user_id)
+    assert await _exp_via_session(router, None, user_id) == 0
+    assert router.sticky_reads == 1
+    # 他のユーザーは引き続きレプリカから読む
+    assert await _exp_via_session(router, user_id + 1) in (1, 2)
+
+
+async def test_stickiness_expires():
+    router = ReplicaRouter(urls=[tmp_db_url("replica1.db")], health_sec=60, max_lag_sec=2, sticky_sec=0.01)
+    try:
+        router.note_write(1)
+        assert router.recently_wrote(1)
+        await asyncio.sleep(0.05)
+        assert not router.recently_wrote(1)
+    finally:
+        await router.stop()
+
+
+async def test_health_check_marks_down_and_recovers():
+    missing_dir = os.path.join(_TMP_DIR, "not-yet")
+    shutil.rmtree(missing_dir, ignore_errors=True)
+    router = ReplicaRouter(
+        urls=[tmp_db_url("replica1.db"), f"sqlite:///{os.path.join(missing_dir, 'r.db')}"],
+        health_sec=60, max_lag_sec=2, sticky_sec=60,
+    )
+    try:
+        await router.check_all()
+        good, broken = router.replicas
+        assert good.healthy and not broken.healthy
+        assert broken.last_error
+        assert {id(router.pick()) for _ in range(4)} == {id(good)}
+
+        os.makedirs(missing_dir)
+        await router.check_all()
+        assert broken.healthy and broken.last_error is None
+        assert {id(router.pick()) for _ in range(4)} == {id(good), id(broken)}
+    finally:
+        await router.stop()
+        shutil.rmtree(missing_dir, ignore_errors=True)
+
+
+async def test_unreachable_replica_is_marked_down_and_read_falls_back(client, monkeypatch, user_id):
+    router = ReplicaRouter(
+        urls=["sqlite:////nonexistent/dir/r.db"], health_sec=60, max_lag_sec=2, sticky_sec=60,
+    )
+    monkeypatch.setattr(replicas, "replica_router", router)
+    monkeypatch.setattr(deps, "replica_router", router)
+    try:
+        for _ in range(3):
+            response = await client.get("/auth/me", cookies=cookies_for(user_id))
+            assert response.status_code == 200
+            assert response.json()["id"] == user_id
+        assert not router.replicas[0].healthy
+        assert router.primary_reads == 3
+    finally:
+        await router.stop()
+
+
+async def test_path_user_reads_go_to_primary_after_a_write(client, router, user_id):
+    assert (await client.get(f"/users/{user_id}/exp")).json()["exp"] in (1, 2)
+    assert (await client.put(f"/users/{user_id}/exp", params={"amount": 10})).json()["exp"] == 10
+    # 書き込んだ直後の読み取りはレプリカ（古い値）ではなく primary から
+    assert (await client.get(f"/users/{user_id}/exp")).json()["exp"] == 10
+    assert router.sticky_reads == 1
+
+
+async def test_db_failure_during_authentication_is_not_a_401(router, monkeypatch, user_id):
+    from app.main import app
+    from app.routers import auth
+
+    async def failing_load(uid, db):
+        raise OperationalError("SELECT", {}, Exception("replica went away"))
+
+    monkeypatch.setattr(auth, "_load_principal", failing_load)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            response = await c.get("/auth/me", cookies=cookies_for(user_id))
+    assert response.status_code == 500
+    # どちらかのレプリカで失敗したので、そのレプリカは外れている
+    assert [r.healthy for r in router.replicas].count(False) == 1
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import select
+
+from app.core.writebehind import write_behind
+from app.db.base import SessionLocal
+from app.db.models import User, UserProgressFlag
+from tests.conftest import add_step, add_user, cookies_for
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def buffered(monkeypatch):
+    # バックグラウンドの反映タスクは動かさず、反映はテストから flush() で行う
+    monkeypatch.setattr(write_behind, "enabled", True)
+    return write_behind
+
+
+async def test_reads_overlay_pending_exp_and_flags(client, buffered):
+    user_id = add_user("a@example.com", exp=100)
+
+    assert (await client.put(f"/users/{user_id}/exp", params={"amount": 15})).json()["exp"] == 115
+    assert (await client.put(f"/users/{user_id}/exp", params={"amount": -5})).json()["exp"] == 110
+    assert (await client.put(f"/users/{user_id}/progress/3")).json()["progress"] == "00010000"
+
+    # DB にはまだ入っていない
+    with SessionLocal() as db:
+        row = db.execute(select(User.exp, User.progress_bits).where(User.id == user_id)).one()
+    assert (row.exp, row.progress_bits) == (100, 0)
+
+    assert (await client.get(f"/users/{user_id}/exp")).json()["exp"] == 110
+    assert (await client.get(f"/users/{user_id}/progress")).json()["progress"] == "00010000"
+
+    assert await buffered.flush() == 1
+    assert buffered.pending_exp(user_id) == 0
+    with SessionLocal() as db:
+        row = db.execute(select(User.exp, User.progress_bits).where(User.id == user_id)).one()
+        flags = db.scalars(select(UserProgressFlag.flag_index).where(UserProgressFlag.user_id == user_id)).all()
+    assert (row.exp, row.progress_bits) == (110, 1 << 3)
+    assert flags == [3]
+
+
+async def test_completed_users_merges_pending_bits_without_flushing(client, buffered):
+    flushed = add_user("a@example.com")
+    pending = [add_user(f"p{i}@example.com") for i in range(3)]
+    await client.put(f"/users/{flushed}/progress/2")
+    await buffered.flush()
+    for user_id in pending:
+        await client.put(f"/users/{user_id}/progress/2")
+
+    first = (await client.get("/users/completed/2", params={"limit": 2})).json()
+    assert first["user_ids"] == [flushed, pending[0]]
+    rest = (await client.get("/users/completed/2", params={"limit": 2, "after_id": first["next_after_id"]})).json()
+    assert rest["user_ids"] == pending[1:]
+    assert (await client.get("/users/completed/1")).json()["user_ids"] == []
+    # 読み取りでは反映しない
+    assert buffered.size == 3
+
+
+async def test_already_cleared_step_reports_pending_exp(client, buffered):
+    user_id = add_user("a@example.com")
+    step_id = add_step(xp_reward=20)
+    cookies = cookies_for(user_id)
+
+    cleared = await client.post("/progress/complete", json={"step_id": step_id}, cookies=cookies)
+    assert cleared.json()["exp"] == 20
+    await client.put(f"/users/{user_id}/exp", params={"amount": 40})
+
+    again = await client.post("/progress/complete", json={"step_id": step_id}, cookies=cookies)
+    assert again.json() == {"message": "Already cleared", "level": 2, "exp": 60}